@@ -15,6 +15,7 @@ try:
     time.sleep(1)
     app = Ursina(borderless=False)
     input_handler = InputHandler()
+    network.simulate_conditions_from_env()
     network.peer.start("localhost", 8080, is_host=False)
 
     app.run()
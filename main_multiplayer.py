@@ -8,4 +8,5 @@ from source.network import network
 
 app = Ursina(borderless=False)
 input_handler = InputHandler()
+network.simulate_conditions_from_env()
 app.run()
\ No newline at end of file
@@ -8,12 +8,14 @@ from source.server.world import world
 
 def start_server(name, port):
     network.peer.start(name, port, is_host=True)
+    network.datagrams.start(name, port, is_host=True)
     world.load_zone("demo.json")
 
 
 if __name__ == "__main__":
     # app = Ursina(window_type="offscreen")
     app = Ursina(window_type="none")
+    network.simulate_conditions_from_env()
     start_server("localhost", 8080)
     app.run()
     
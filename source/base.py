@@ -11,6 +11,50 @@ models_path = Path(os.path.join(assets_path, "models"))
 
 PHYSICS_UPDATE_RATE = 1 / 20
 POWER_UPDATE_RATE = 1 / 5
+# Most server ticks run in one frame to catch up after a stall, see ServerTicker
+MAX_CATCH_UP_TICKS = 5
+
+# Fixed-point precision of positions/rotations sent over the network, see quantize.py
+# Positions are in world units per step, 24 bits gives a range of +/- 32768 units
+POSITION_QUANTUM = 1 / 256
+POSITION_BITS = 24
+ROTATION_BITS = 16
+
+# Characters further than this from a player character aren't sent to its client
+INTEREST_RADIUS = 100
+INTEREST_CELL_SIZE = 25
+# Most characters sent to a client in a single spawn message
+SPAWN_CHUNK_SIZE = 32
+# Most characters in a single snapshot datagram, keeps them under MAX_DATAGRAM_SIZE
+MAX_SNAPSHOTS_PER_DATAGRAM = 48
+# Snapshot datagrams are numbered (tick << SNAPSHOT_CHUNK_BITS) + their index within the tick,
+# and clients send these numbers back to acknowledge them
+SNAPSHOT_CHUNK_BITS = 8
+# A character is only included in a connection's snapshot if it moved/turned further than
+# these since the last state the client acknowledged, or if it hasn't been sent for
+# SNAPSHOT_KEEPALIVE_TICKS
+SNAPSHOT_POSITION_THRESHOLD = 0.01
+SNAPSHOT_ROTATION_THRESHOLD = 0.5
+SNAPSHOT_KEEPALIVE_TICKS = 20
+# Per-connection snapshot bandwidth budgets in bytes per second, see SendScheduler
+SEND_BUDGET_DEFAULT = 32000
+SEND_BUDGET_MIN = 2000
+SEND_BUDGET_MAX = 128000
+SEND_BUDGET_INCREASE = 2000
+SEND_BUDGET_DECREASE = 0.75
+# Most seconds of budget that can be saved up and spent at once
+SEND_MAX_BURST = 0.25
+# Fraction of snapshots lost, or seconds of round trip time above twice the lowest seen,
+# beyond which a connection is treated as congested
+SEND_LOSS_THRESHOLD = 0.05
+SEND_RTT_SLACK = 0.05
+# Priority per tick of the player's target, other characters get 1 / (1 + (distance / falloff) ** 2)
+SEND_TARGET_WEIGHT = 4
+SEND_DISTANCE_FALLOFF = 20
+# Most movement inputs the server holds for a client before dropping the oldest
+MAX_QUEUED_INPUTS = 8
+# Ticks a character must stay grounded without moving before its physics stops being stepped
+SLEEP_TICKS = 10
 
 fists_base_dmg = 2
 
@@ -21,6 +65,18 @@ all_skills = [
 ]
 skill_to_idx = {skill: i for i, skill in enumerate(all_skills)}
 
+# Templates for game window messages, sent by index and formatted by the client. See GameEvent
+event_templates = {
+    "cant_see": "You can't see {tgt}.",
+    "out_of_range": "{tgt} is out of range!",
+    "miss": "{src} attempts to hit {tgt}, but misses!",
+    "hit": "{src} hits {tgt} for {val} damage!",
+    "effect_damage": "{tgt} is damaged for {val} damage!",
+    "effect_heal": "{src} heals {tgt} for {val} health!",
+}
+all_events = list(event_templates)
+event_to_idx = {event: i for i, event in enumerate(all_events)}
+
 all_stats = [
     "health",
     "energy",
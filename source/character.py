@@ -11,6 +11,7 @@ from ursina.mesh_importer import imported_meshes
 from panda3d.core import NodePath
 
 from .base import *
+from .physics import cast_ray
 from .states import *
 
 class Character(Entity):
@@ -36,8 +37,8 @@ class Character(Entity):
         src_pos = self.position + Vec3(0, 0.8 * self.scale_y, 0)
         tgt_pos = target.position + Vec3(0, 0.8 * target.scale_y, 0)
         dir = tgt_pos - src_pos
-        line_of_sight = raycast(src_pos, direction=dir, distance=inf,
-                                ignore=[entity for entity in scene.entities if isinstance(entity, Character)])
+        line_of_sight = cast_ray(src_pos, dir, inf,
+                                 ignore=[entity for entity in scene.entities if isinstance(entity, Character)])
         if line_of_sight.hit:
             entity = line_of_sight.entity
             if sqdist(entity.position, self.position) < sdist:
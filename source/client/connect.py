@@ -22,9 +22,22 @@ def on_connect(connection, time_received):
     login_state = world.load_player_data(player_name)
     network.peer.request_enter_world(connection, login_state)
 
+@rpc(network.peer)
+def remote_datagram_token(connection, time_received, token: int):
+    """Server sent the token to identify this client on the datagram channel"""
+    network.datagrams.bind_server(connection, token)
+
+@rpc(network.peer)
+def remote_clock_pong(connection, time_received, client_time: float, server_recv_time: float,
+                      server_send_time: float):
+    """Server replied to a clock ping, see clock.py"""
+    network.clock.add_sample(client_time, server_recv_time, server_send_time, time_received)
+
 @rpc(network.peer)
 def on_disconnect(connection, time_received):
     """What a client should do when disconnecting.
-    Right now, this is blank because there's nothing to do upon disconnection.
+    Right now, this only forgets the server connection.
     Once I implement a real client, this will be populated"""
-    pass
+    network.datagrams.remove_connection(connection)
+    network.server_connection = None
+    network.snapshot_acks.clear()
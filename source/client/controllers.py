@@ -3,12 +3,40 @@ from ursina import *
 from .. import *
 
 
+# Number of past inputs remembered for reconciliation, 3.2 seconds at 20 ticks per second
+INPUT_BUFFER_SIZE = 64
+# Ticks between sending movement inputs when they haven't changed
+INPUT_HEARTBEAT_TICKS = 20
+# Fraction of a reconciliation correction still shown after each tick, so corrections are
+# blended in over a few ticks rather than snapped to
+CORRECTION_DECAY = 0.5
+
+
+class InputRecord:
+    """One tick of movement input, along with the state predicted after applying it"""
+    def __init__(self, sequence_number, kb_direction, kb_y_rotation, mouse_y_rotation, jumped):
+        self.sequence_number = sequence_number
+        self.kb_direction = kb_direction
+        self.kb_y_rotation = kb_y_rotation
+        self.mouse_y_rotation = mouse_y_rotation
+        self.jumped = jumped
+        self.position = None
+        self.rotation_y = None
+        self.grounded = None
+        self.velocity_components = None
+
+
 class PlayerController(Entity):
     """Singleton class that processes movement inputs to update character position/rotation.
 
     Does not update these attributes directly, instead interfaces to lerp_system.LerpState
     to update target attributes and smoothly interpolate each frame. Movement uses client-side
-    prediction with correction for server updates."""
+    prediction with correction for server updates.
+
+    Each tick's input is sent to the server and applied locally, and kept in a ring buffer with
+    the predicted state. When the server acknowledges an input, the character is rewound to the
+    server's state after it, and the inputs the server hasn't processed yet are replayed on top.
+    The difference from the old prediction is shown as a correction which fades out."""
     def __init__(self, character, lerp_state):
         super().__init__()
         self.character = character
@@ -16,49 +44,59 @@ class PlayerController(Entity):
         # The sequence number of movement inputs
         self.sequence_number = 0
         # The most recent received sequence number
-        self.recv_sequence_number = 0
-        # Remember the position/rotation when we sent sequence numbers
-        self.sn_to_pos = {}
-        self.sn_to_rot = {}
-        # Components to build target rotation
+        self.recv_sequence_number = -1
+        self.input_buffer = [None] * INPUT_BUFFER_SIZE
+        # Current inputs, set by the InputHandler
+        self.keyboard_direction = Vec2(0, 0)
         self.keyboard_y_rotation = 0
         self.mouse_y_rotation = 0
-        self.rot_offset = 0 # Predicted difference from server's rotation
+        self.jumped = False
+        # Last inputs sent to the server, and the sequence number they were sent with
+        self.sent_input = None
+        self.sent_sequence_number = -1
+        # Predicted physical state, the character itself is positioned by the LerpState
+        self.predicted_pos = character.position
+        self.predicted_rot = character.rotation_y
+        # Offset from the predicted state that's still being shown from past corrections
+        self.pos_correction = Vec3(0, 0, 0)
+        self.rot_correction = 0
 
-    @every(PHYSICS_UPDATE_RATE)
     def tick_movement(self):
-        """Update target position/rotation on a fixed interval"""
+        """Sends this tick's inputs to the server if needed, and predicts their result"""
         char = self.character
         if char is None:
             return
-        # Client-side prediction for movement/rotation
-        set_gravity_vel(char)
-        displacement = get_displacement(char)
-        # Update target position, lag behind by one timestep
-        target_pos = char.position + displacement
-        input_rot = self.keyboard_y_rotation * 100 * PHYSICS_UPDATE_RATE + self.mouse_y_rotation
-        target_rot = char.rotation_y + input_rot + self.rot_offset
-        self.lerp_state.update_targets(target_pos, target_rot)
+        record = InputRecord(self.sequence_number, self.keyboard_direction, self.keyboard_y_rotation,
+                             self.mouse_y_rotation, self.jumped)
+        self.send_input(record)
+        self.input_buffer[record.sequence_number % INPUT_BUFFER_SIZE] = record
+        self.move_to_predicted()
+        self.simulate_input(record)
+        self.save_predicted(record)
+        self.update_lerp_targets()
         # Just some necessary bookkeeping things
-        char.displacement_components["server_offset"] = Vec3(0, 0, 0)
-        self.rot_offset = 0
         self.mouse_y_rotation = 0
+        self.jumped = False
         self.sequence_number += 1
 
-    def update_keyboard_inputs(self, fwdback, strafe, rightleft_rot):
-        """Updates keyboard velocity and y rotation, and sends request to server to move."""
-        char = self.character
-        # Keyboard velocity
-        char_speed = get_speed_modifier(char.speed)
-        kb_vel = (char.right * strafe + char.forward * fwdback).normalized() * 10 * char_speed
-        char.velocity_components["keyboard"] = kb_vel
-        # Keyboard rotation
+    def send_input(self, record):
+        """Sends an input to the server if it differs from the last one sent, or as a heartbeat
+        every INPUT_HEARTBEAT_TICKS. The server repeats the last input it received until then."""
+        keyboard_input = (record.kb_direction, record.kb_y_rotation)
+        if keyboard_input == self.sent_input and record.mouse_y_rotation == 0 and not record.jumped \
+                and record.sequence_number - self.sent_sequence_number < INPUT_HEARTBEAT_TICKS:
+            return
+        network.peer.request_move(network.server_connection, record.sequence_number,
+                                  record.kb_direction, record.kb_y_rotation, record.mouse_y_rotation,
+                                  record.jumped)
+        self.sent_input = keyboard_input
+        self.sent_sequence_number = record.sequence_number
+
+    def tick_inputs(self, fwdback, strafe, rightleft_rot):
+        """Sets this tick's keyboard inputs and runs its movement"""
+        self.keyboard_direction = Vec2(strafe, fwdback)
         self.keyboard_y_rotation = rightleft_rot
-        # Server update
-        conn = network.server_connection
-        keyboard_direction = Vec2(strafe, fwdback)
-        network.peer.request_move(conn, self.sequence_number, keyboard_direction,
-                                     rightleft_rot, self.mouse_y_rotation)
+        self.tick_movement()
 
     def update_mouse_y_rotation(self, amt):
         """Updates self.mouse_y_rotation with rotation obtained from mouse movement
@@ -68,36 +106,82 @@ class PlayerController(Entity):
         used to determine the next target_rot."""
         self.mouse_y_rotation += amt
 
-    def update_server_offsets(self, sequence_number, pos, rot):
-        """Updates diff between server's pos/rot and client's pos/rot from a past moment
-        in time"""
-        if sequence_number > self.recv_sequence_number:
-            self.recv_sequence_number = sequence_number
-            for num in self.sn_to_pos.copy():
-                if num < sequence_number:
-                    self.sn_to_pos.pop(num)
-                    self.sn_to_rot.pop(num)
-        else:
-            # Always take the most recent sequence number
-            # Alternatively, reject completely if it's old
-            sequence_number = self.recv_sequence_number
-        # Compute the offset amt for position
-        # sn_to_pos is missing sequence_number on startup
-        predicted_pos = self.sn_to_pos.get(sequence_number, pos)
-        pos_offset = pos - predicted_pos
-        self.character.displacement_components["server_offset"] = pos_offset
-        # Compute the offset amt for rotation
-        rot = rot % 360
-        predicted_rot = self.sn_to_rot.get(sequence_number, rot)
-        rot_offset = rot - predicted_rot
-        self.rot_offset = rot_offset
+    def simulate_input(self, record):
+        """Advances the character's physical state by one tick of input, the same way as
+        the server's MovementSystem"""
+        char = self.character
+        if record.jumped:
+            char_start_jump(char)
+        char_speed = get_speed_modifier(char.speed)
+        kb_dir = record.kb_direction
+        char.velocity_components["keyboard"] = (char.right * kb_dir[0] + char.forward * kb_dir[1]).normalized() \
+            * 10 * char_speed
+        char.rotation_y += record.kb_y_rotation * 100 * PHYSICS_UPDATE_RATE + record.mouse_y_rotation
+        set_gravity_vel(char)
+        char.position += get_displacement(char)
+        char.velocity_components["keyboard"] = Vec3(0, 0, 0)
+
+    def move_to_predicted(self):
+        """Places the character at its predicted state so physics can be run from it.
+        The LerpState moves it back to where it's shown."""
+        self.character.position = self.predicted_pos
+        self.character.rotation_y = self.predicted_rot
+
+    def save_predicted(self, record):
+        """Records the character's current physical state as the prediction after record"""
+        char = self.character
+        self.predicted_pos = char.position
+        self.predicted_rot = char.rotation_y
+        record.position = char.position
+        record.rotation_y = char.rotation_y
+        record.grounded = char.grounded
+        record.velocity_components = dict(char.velocity_components)
+
+    def update_lerp_targets(self):
+        """Points the LerpState at the predicted state plus what's left of the corrections"""
+        target_pos = self.predicted_pos + self.pos_correction
+        target_rot = self.predicted_rot + self.rot_correction
+        self.lerp_state.update_targets(target_pos, target_rot)
+        self.pos_correction *= CORRECTION_DECAY
+        self.rot_correction *= CORRECTION_DECAY
+
+    def reconcile(self, sequence_number, pos, rot):
+        """Rewinds to the server's state after the input sequence_number, and replays the inputs
+        the server hasn't acknowledged yet
+
+        pos: server's position of the character after the input
+        rot: server's rotation of the character after the input"""
+        if sequence_number <= self.recv_sequence_number:
+            return
+        self.recv_sequence_number = sequence_number
+        record = self.input_buffer[sequence_number % INPUT_BUFFER_SIZE]
+        if record is None or record.sequence_number != sequence_number or record.position is None:
+            # Nothing to compare against, such as when first spawning
+            return
+        char = self.character
+        old_pos, old_rot = self.predicted_pos, self.predicted_rot
+        char.position = pos
+        char.rotation_y = rot % 360
+        char.grounded = record.grounded
+        char.velocity_components = dict(record.velocity_components)
+        for num in range(sequence_number + 1, self.sequence_number):
+            replay = self.input_buffer[num % INPUT_BUFFER_SIZE]
+            if replay is None or replay.sequence_number != num:
+                break
+            self.simulate_input(replay)
+            self.save_predicted(replay)
+        self.predicted_pos = char.position
+        self.predicted_rot = char.rotation_y
+        # Show the old prediction for now, and blend into the corrected one
+        self.pos_correction += old_pos - self.predicted_pos
+        self.rot_correction += (old_rot - self.predicted_rot + 180) % 360 - 180
+        # LerpState puts the character back where it's shown on the next frame
 
     def do_jump(self):
-        """Update character's velocity components from a jump input, tell server"""
+        """Jumps on the next tick, which sends the jump to the server with that tick's input"""
         if self.character is None:
             return
-        char_start_jump(self.character)
-        network.peer.request_jump(network.server_connection)
+        self.jumped = True
 
 
 class NPCController:
@@ -105,17 +189,15 @@ class NPCController:
     def __init__(self, character, lerp_state):
         self.character = character
         self.lerp_state = lerp_state
-        self.prev_recv_t = 0
 
-    def update_lerp_targets(self, time_received, pos, rot):
-        """Updates targets for self.lerp_state
+    def update_lerp_targets(self, server_time, pos, rot, held=False):
+        """Adds a snapshot to self.lerp_state's buffer
 
-        Deduces a time interval for LERPing by subtracting previous packet time by
-        this packet's timestamp. This is likely to be wrong when latency is irregular.
-        time_received: timestamp of this packet
+        Since snapshots are stamped with the server's time, irregular latency doesn't affect
+        how long the character takes to move between them.
+        server_time: server's timestamp of the snapshot
         pos: target position
         rot: target rotation
+        held: whether the server left the character out since its last snapshot for not moving
         """
-        lerp_time = time_received - self.prev_recv_t
-        self.prev_recv_t = time_received
-        self.lerp_state.update_targets(pos, rot, lerp_time)
+        self.lerp_state.add_snapshot(server_time, pos, rot, held)
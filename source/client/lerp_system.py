@@ -1,19 +1,57 @@
 from ursina import *
 
+from .. import network
 from ..physics import PHYSICS_UPDATE_RATE
 
+# How far in the past, in server time, NPCs are rendered. Leaves room for the next snapshot
+# to arrive late without running out of samples to interpolate between.
+INTERPOLATION_DELAY = 2 * PHYSICS_UPDATE_RATE
+# Longest an NPC is extrapolated past its newest snapshot before it stops moving
+MAX_EXTRAPOLATION = 2 * PHYSICS_UPDATE_RATE
+MAX_SNAPSHOTS = 32
+# How quickly the fallback server clock estimate follows snapshots which arrive later than
+# expected, per snapshot. Ones that arrive earlier are followed immediately.
+CLOCK_DRIFT_RATE = 0.05
+
 
 class LerpSystem(Entity):
+    """Smooths characters' position/rotation between network updates.
+
+    The player character lerps towards targets set by its PlayerController. NPCs keep a buffer
+    of snapshots stamped with the server's time, and are rendered INTERPOLATION_DELAY behind the
+    estimated server time by interpolating between the two snapshots around it. The server time
+    comes from network.server_time once the clock is synchronized, and is estimated from snapshot
+    timestamps until then."""
     def __init__(self, gamestate):
         super().__init__()
         self.uuid_to_lerp = gamestate.uuid_to_lerp
+        # Estimate of server time minus local time from snapshots
+        self.clock_offset = None
 
     def make_lerp_state(self, character):
         self.uuid_to_lerp[character.uuid] = LerpState(character)
 
+    def update_clock(self, server_time, time_received):
+        """Updates the server clock estimate from a snapshot's server timestamp"""
+        offset = server_time - time_received
+        if self.clock_offset is None or offset > self.clock_offset:
+            self.clock_offset = offset
+        else:
+            self.clock_offset += (offset - self.clock_offset) * CLOCK_DRIFT_RATE
+
+    def get_render_time(self):
+        """Returns the server time that NPCs should currently be shown at"""
+        if network.clock.is_synced():
+            return network.server_time() - INTERPOLATION_DELAY
+        return time.time() + (self.clock_offset or 0) - INTERPOLATION_DELAY
+
     def update(self):
+        render_time = self.get_render_time()
         for lerp_state in self.uuid_to_lerp.values():
-            lerp_state.lerp(time.dt)
+            if lerp_state.snapshots:
+                lerp_state.interpolate(render_time)
+            else:
+                lerp_state.lerp(time.dt)
 
 
 class LerpState:
@@ -27,6 +65,8 @@ class LerpState:
         self.target_rot = self.character.rotation_y
         self.lerp_timer = 0
         self.lerp_time = PHYSICS_UPDATE_RATE
+        # Time-ordered (server time, position, rotation) samples, only used for NPCs
+        self.snapshots = []
 
     def lerp(self, dt):
         self.lerp_timer += dt
@@ -47,3 +87,53 @@ class LerpState:
         self.target_rot = rot
         self.lerp_timer = 0
         self.lerp_time = time
+
+    def add_snapshot(self, server_time, pos, rot, held=False):
+        """Inserts a server-stamped sample into the snapshot buffer
+
+        held: whether the server left the character out since the previous sample because it
+        wasn't moving. Gaps can also come from the server's bandwidth budget, in which case
+        the character kept moving and is interpolated across the gap."""
+        snapshots = self.snapshots
+        if snapshots and server_time <= snapshots[-1][0]:
+            # Arrived out of order, or a duplicate
+            i = len(snapshots) - 1
+            while i >= 0 and snapshots[i][0] > server_time:
+                i -= 1
+            if i >= 0 and snapshots[i][0] == server_time:
+                return
+            snapshots.insert(i + 1, (server_time, pos, rot))
+            return
+        if held and snapshots and server_time - snapshots[-1][0] > 1.5 * PHYSICS_UPDATE_RATE:
+            # It was still at its last position until the tick before this one
+            _, prev_pos, prev_rot = snapshots[-1]
+            snapshots.append((server_time - PHYSICS_UPDATE_RATE, prev_pos, prev_rot))
+        snapshots.append((server_time, pos, rot))
+        if len(snapshots) > MAX_SNAPSHOTS:
+            del snapshots[:len(snapshots) - MAX_SNAPSHOTS]
+
+    def interpolate(self, render_time):
+        """Sets position/rotation to where the character was at render_time in server time"""
+        snapshots = self.snapshots
+        # Drop samples older than the one just before render_time, but always keep two so
+        # there's a velocity to extrapolate with
+        i = 0
+        while i + 2 < len(snapshots) and snapshots[i + 1][0] <= render_time:
+            i += 1
+        if i > 0:
+            del snapshots[:i]
+        if len(snapshots) == 1 or render_time <= snapshots[0][0]:
+            _, pos, rot = snapshots[0]
+        else:
+            t0, pos0, rot0 = snapshots[0]
+            t1, pos1, rot1 = snapshots[1]
+            # Past the newest sample, keep moving the same way for a short time
+            render_time = min(render_time, t1 + MAX_EXTRAPOLATION)
+            pct = (render_time - t0) / (t1 - t0)
+            pos = lerp(pos0, pos1, pct)
+            rot = lerp_angle(rot0, rot1, pct)
+        self.character.position = pos
+        self.character.rotation_y = rot
+        # Fix character rotation
+        self.character.rotation_x = 0
+        self.character.rotation_z = 0
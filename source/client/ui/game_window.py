@@ -36,6 +36,17 @@ class GameWindow(UIWindow):
         grid(self.scrollbar, num_rows=1, num_cols=1, color=color.gray)
 
     def add_message(self, msg):
+        self.add_messages([msg])
+
+    def add_messages(self, msgs):
+        """Adds several messages at once, only updating visibility and the scrollbar once"""
+        for msg in msgs:
+            self.place_message(msg)
+        self.update_text_visibility()
+        self.scrollbar.update_scroller_scale_y()
+
+    def place_message(self, msg):
+        """Creates the Text for a new message at the bottom of the window"""
         wordwrap = self.get_word_wrap(msg, self.textbox.world_scale_x)
         # wordwrap = 45
         # This has the potential to be buggy if there's a single word with length equal to wordwrap minus 1
@@ -47,8 +58,6 @@ class GameWindow(UIWindow):
         self.messages.append(Text(text=msg, parent=self.text_top, world_scale=self.font_size,
                                   world_position=self.text_bottom.world_position, origin=(-0.5, -0.5),
                                   color=text_color, wordwrap=wordwrap))
-        self.update_text_visibility()
-        self.scrollbar.update_scroller_scale_y()
 
     def get_word_wrap(self, txt, max_width):
         cur_width = 0
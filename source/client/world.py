@@ -16,6 +16,7 @@ from .lerp_system import LerpSystem
 from .namelabel_system import NameLabelSystem
 from .power_system import PowerSystem
 from .ui import ui
+from ..collision import CollisionWorld
 from .. import *
 
 class World:
@@ -49,11 +50,17 @@ class World:
         zonepath = os.path.join(self.zones_path, file)
         with open(zonepath) as f:
             world_data = json.load(f)
+        # Positions are sent relative to the zone's origin
+        PackedPosition.configure(origin=world_data.get("origin", (0, 0, 0)))
         Sky(**world_data["sky"])
+        self.collision_world = CollisionWorld()
         for name, data in world_data["entities"].items():
             if "color" in data and isinstance(data["color"], str):
                 data["color"] = color.colors[data["color"]]
+            self.collision_world.add_entity(name, data)
             Entity(**data)
+        self.collision_world.build()
+        set_collision_world(self.collision_world)
 
     def load_player_data(self, cname):
         """Loads player data from players.json as a LoginState"""
@@ -81,6 +88,7 @@ class World:
         for key in default_char_attrs:
             if key in spawn_state.statedef:
                 init_dict[key] = spawn_state[key]
+        init_dict["rotation_y"] = spawn_state["rotation_y"]
         # Make equipment
         equipment_inst_ids = spawn_state["equipment_inst_ids"]
         items = [self.items_manager.make_item(item_mnem, inst_id) if item_mnem != "" and inst_id >= 0
@@ -138,15 +146,33 @@ class World:
         """Create an NPC from the server's inputs.
 
         init_dict is a dict obtained from World.make_npc_init_dict"""
-        new_char = ClientCharacter(**init_dict)
-        self.uuid_to_char[new_char.uuid] = new_char
-        self.namelabel_system.create_namelabel(new_char)
-        self.animation_system.make_animator(new_char)
-        self.lerp_system.make_lerp_state(new_char)
+        return self.make_npcs([init_dict])[0]
+
+    def make_npcs(self, init_dicts):
+        """Create a batch of NPCs from the server's inputs.
+
+        init_dicts is a list of dicts obtained from World.make_npc_init_dict"""
+        new_chars = []
+        for init_dict in init_dicts:
+            new_char = ClientCharacter(**init_dict)
+            self.uuid_to_char[new_char.uuid] = new_char
+            self.namelabel_system.create_namelabel(new_char)
+            self.animation_system.make_animator(new_char)
+            self.lerp_system.make_lerp_state(new_char)
+            new_chars.append(new_char)
         if self.gamestate.pc:
             # Hmm... figure out a better way to do this
-            self.gamestate.pc.ignore_traverse.append(new_char.clickbox)
-        return new_char
+            self.gamestate.pc.ignore_traverse.extend(char.clickbox for char in new_chars)
+        return new_chars
+
+    def format_event(self, event):
+        """Converts a GameEvent into the text of a game window message"""
+        names = []
+        for uuid in (event["src_uuid"], event["tgt_uuid"]):
+            char = self.uuid_to_char.get(uuid)
+            names.append(char.cname if char is not None else "Someone")
+        template = event_templates[all_events[event["event_id"]]]
+        return template.format(src=names[0], tgt=names[1], val=event["val"])
 
     def make_npc_ctrl(self, uuid):
         """Makes an npc controller while updating uuid map.
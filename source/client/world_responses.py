@@ -32,11 +32,27 @@ def spawn_pc(connection, time_received, spawn_state: PCSpawnState):
     ui.make_all_ui(world)
 
 @rpc(network.peer)
-def spawn_npc(connection, time_received, spawn_state: NPCSpawnState):
-    """Remotely spawn a character that isn't the client's player character (could also be other players)"""
-    init_dict = world.make_npc_init_dict(spawn_state)
-    new_npc = world.make_npc(init_dict)
-    world.make_npc_ctrl(new_npc.uuid)
+def spawn_npcs(connection, time_received, spawn_states: list[NPCSpawnState], remaining: int):
+    """Remotely spawn a chunk of characters that aren't the client's player character (could also
+    be other players)
+
+    remaining: number of characters still waiting to be sent, if positive the server waits for
+    this client to request them"""
+    init_dicts = [world.make_npc_init_dict(spawn_state) for spawn_state in spawn_states]
+    for new_npc in world.make_npcs(init_dicts):
+        world.make_npc_ctrl(new_npc.uuid)
+    if remaining > 0:
+        network.peer.request_spawn_chunk(connection)
+
+@rpc(network.peer)
+def remote_despawn(connection, time_received, uuid: int):
+    """Remove a character that's no longer within the player character's view"""
+    if uuid not in world.uuid_to_ctrl:
+        return
+    pc = world.gamestate.pc
+    if pc is not None and pc.target is world.uuid_to_char[uuid]:
+        pc.target = None
+    world.cleanup_manager.cleanup_npc(uuid)
 
 # Combat
 @rpc(network.peer)
@@ -119,27 +135,37 @@ def remote_print(connection, time_received, msg: str):
     if ui.gamewindow:
         ui.gamewindow.add_message(msg)
 
-# Physical
 @rpc(network.peer)
-def update_npc_lerp_attrs(connection, time_received, uuid: int, pos: Vec3, rot: float):
-    """Called by server to update physical state for an NPC"""
-    controller = world.uuid_to_ctrl.get(uuid)
-    if controller is None:
-        return
-    controller.update_lerp_targets(time_received, pos, rot)
+def remote_game_events(connection, time_received, events: list[GameEvent]):
+    """Format and print all game events generated for this player during a server tick"""
+    if ui.gamewindow:
+        ui.gamewindow.add_messages([world.format_event(event) for event in events])
 
+# Physical
 @rpc(network.peer)
-def update_pc_lerp_attrs(connection, time_received, sequence_number: int, pos: Vec3, rot: float):
-    """Called by server to update physical state for a player character"""
-    if world.gamestate.pc is None:
-        return
-    # To check synchronization, uncomment these:
-    # print(rot % 360)
-    # print(world.gamestate.pc.rotation_y)
-    # print(pos)
-    # print(world.gamestate.pc.position)
-    controller = world.gamestate.pc_ctrl
-    controller.update_server_offsets(sequence_number, pos, rot)
+def update_snapshot(connection, time_received, server_time: float, snapshot_id: int,
+                    sequence_number: int, snapshot: list[SnapshotState], held_mask: int):
+    """Called by server once per physics tick to update physical state of all characters
+
+    server_time: server's clock when the snapshot was taken
+    snapshot_id: sent back to the server to acknowledge this snapshot
+    sequence_number: most recent movement input sequence number processed for the player character
+    snapshot: positions/rotations of every character
+    held_mask: bit i is set if snapshot[i]'s character was left out of earlier snapshots for
+    not moving, rather than for lack of bandwidth"""
+    world.lerp_system.update_clock(server_time, time_received)
+    network.snapshot_acks.append(snapshot_id)
+    pc = world.gamestate.pc
+    for i, state in enumerate(snapshot):
+        uuid = state["uuid"]
+        if pc is not None and uuid == pc.uuid:
+            world.gamestate.pc_ctrl.reconcile(sequence_number, state["position"], state["rotation_y"])
+            continue
+        controller = world.uuid_to_ctrl.get(uuid)
+        if controller is None:
+            continue
+        controller.update_lerp_targets(server_time, state["position"], state["rotation_y"],
+                                       bool(held_mask & (1 << i)))
 
 @rpc(network.peer)
 def update_pos_rot(connection, time_received, uuid: int, pos: Vec3, rot: Vec3):
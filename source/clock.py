@@ -0,0 +1,61 @@
+"""Estimates the server's clock on clients.
+
+Clients periodically send a ping with their local time, and the server replies with the
+times it received the ping and sent the reply. As in NTP, each exchange gives a round trip
+time which excludes the server's processing time, and an offset between the clocks which
+is exact if the trip took as long both ways. Exchanges that took the least time are the
+least affected by queueing, so the offset is taken from the fastest recent exchange."""
+import time
+
+# Seconds between pings, faster until enough samples are collected to trust the estimate
+PING_INTERVAL = 1
+STARTUP_PING_INTERVAL = 0.2
+NUM_SAMPLES = 8
+MIN_SYNC_SAMPLES = 3
+# Weights of new samples in the smoothed round trip time and its variation, as in TCP
+RTT_GAIN = 1 / 8
+RTT_VAR_GAIN = 1 / 4
+
+
+class ClockSync:
+    def __init__(self):
+        # Most recent (round trip time, offset) samples
+        self.samples = []
+        self.num_samples = 0
+        self.offset = 0.0
+        self.rtt = None
+        self.rtt_var = 0.0
+        self.last_ping_time = 0
+
+    def is_synced(self):
+        return self.num_samples >= MIN_SYNC_SAMPLES
+
+    def server_time(self):
+        """Returns the current time on the server's clock"""
+        return time.time() + self.offset
+
+    def needs_ping(self):
+        """Whether it's time to send another ping"""
+        interval = PING_INTERVAL if self.is_synced() else STARTUP_PING_INTERVAL
+        return time.time() - self.last_ping_time >= interval
+
+    def make_ping(self):
+        """Returns the local time to send in a ping"""
+        self.last_ping_time = time.time()
+        return self.last_ping_time
+
+    def add_sample(self, client_send_time, server_recv_time, server_send_time, client_recv_time):
+        """Adds the result of a ping/pong exchange"""
+        rtt = max(0.0, (client_recv_time - client_send_time) - (server_send_time - server_recv_time))
+        offset = ((server_recv_time - client_send_time) + (server_send_time - client_recv_time)) / 2
+        self.samples.append((rtt, offset))
+        if len(self.samples) > NUM_SAMPLES:
+            self.samples.pop(0)
+        self.num_samples += 1
+        self.offset = min(self.samples)[1]
+        if self.rtt is None:
+            self.rtt = rtt
+            self.rtt_var = rtt / 2
+        else:
+            self.rtt_var += (abs(rtt - self.rtt) - self.rtt_var) * RTT_VAR_GAIN
+            self.rtt += (rtt - self.rtt) * RTT_GAIN
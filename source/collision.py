@@ -0,0 +1,528 @@
+"""Static collision geometry answered without Panda3D's scene graph.
+
+A CollisionWorld holds the box colliders of a zone's entities as oriented boxes, fitted the
+same way Ursina fits collider="box" to an entity's model, and answers ray and sweep queries
+against them with plain arithmetic. Once set with physics.set_collision_world, character
+physics and line of sight use it instead of Ursina's raycast, which traverses every collider
+in the scene.
+
+check_parity compares its answers with Ursina's raycast, as long as the zone's entities
+still exist in the scene."""
+import math
+import random
+
+from ursina import Vec3
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Local (center, size) bounds of Ursina's built-in models. A plane lies flat in xz and a quad
+# stands in xy, Ursina gives their colliders a minimum thickness.
+MODEL_BOUNDS = {
+    "cube": ((0, 0, 0), (1, 1, 1)),
+    "plane": ((0, 0, 0), (1, 0, 1)),
+    "quad": ((0, 0, 0), (1, 1, 0)),
+}
+MIN_HALF_EXTENT = 0.001
+# Directions closer to parallel with a box face than this never cross it
+PARALLEL_EPSILON = 1e-12
+# Most boxes in a BVH leaf, tested one by one once the ray reaches the leaf
+BVH_LEAF_SIZE = 4
+# Most that check_parity scales its point tolerance by for rays at grazing angles to a face
+MAX_GRAZING_SCALE = 100
+# Most rays tested at once by raycast_batch, bounds the size of its ray/node pair arrays
+RAY_BATCH_SIZE = 256
+
+
+class CollisionWorld:
+    def __init__(self):
+        self.boxes = []
+        self.name_to_box = dict()
+        # Rebuilt by the first query after boxes are added
+        self.bvh = None
+        # NumPy arrays of the boxes for raycast_batch, only if NumPy is installed
+        self.arrays = None
+
+    def add_entity(self, name, data):
+        """Adds the collider of a zone entity, returns its StaticBox or None if it has no collider
+
+        Colliders that can't be represented are skipped with a warning, characters will pass
+        through them.
+
+        data: the entity's kwargs from the zone json"""
+        collider = data.get("collider")
+        if collider is None:
+            return None
+        if collider != "box":
+            print(f"Skipping entity {name} in collision world, unsupported collider {collider}")
+            return None
+        model = data.get("model")
+        if model not in MODEL_BOUNDS:
+            print(f"Skipping entity {name} in collision world, can't fit a box collider to model {model}")
+            return None
+        center, size = MODEL_BOUNDS[model]
+        # The origin offsets the model, and its collider, from the entity's position
+        origin = get_vec(data, "origin", 0)
+        center = [c - o for c, o in zip(center, origin)]
+        half_extents = [max(MIN_HALF_EXTENT, s / 2) for s in size]
+        box = StaticBox(name, get_vec(data, "position", 0), get_vec(data, "rotation", 0),
+                        get_vec(data, "scale", 1), center, half_extents)
+        self.add_box(box)
+        return box
+
+    def add_box(self, box):
+        self.boxes.append(box)
+        self.name_to_box[box.name] = box
+        self.bvh = None
+        self.arrays = None
+
+    def build(self):
+        """Builds the BVH over all boxes. Queries build it when needed, but building up front
+        keeps the cost out of the first tick."""
+        self.bvh = BVH(self.boxes)
+        if np is not None:
+            self.arrays = BoxArrays(self.bvh)
+
+    def raycast(self, origin, direction, distance=math.inf):
+        """Returns a RayHit for the closest box hit by a ray within distance
+
+        Mirrors Ursina's raycast, a ray starting inside a box hits it where it leaves."""
+        return self.sweep(origin, direction, distance, 0)
+
+    def sweep(self, origin, direction, distance=math.inf, radius=0):
+        """Returns a RayHit for the first box touched by a sphere of radius moving from origin
+        along direction for up to distance
+
+        Each box is grown by radius on every side, which is exact on faces and slightly
+        conservative at edges and corners. world_point is where the sphere's center stops."""
+        length = math.sqrt(direction[0] ** 2 + direction[1] ** 2 + direction[2] ** 2)
+        if length == 0:
+            return RayHit(False, distance=distance)
+        direction = (direction[0] / length, direction[1] / length, direction[2] / length)
+        if self.bvh is None:
+            self.build()
+        closest = self.bvh.intersect_ray(origin, direction, distance, radius)
+        if closest is None:
+            return RayHit(False, distance=distance)
+        box, closest_distance, normal = closest
+        point = Vec3(*(o + d * closest_distance for o, d in zip(origin, direction)))
+        return RayHit(True, entity=box, distance=closest_distance, world_point=point,
+                      world_normal=Vec3(*normal))
+
+    def raycast_batch(self, origins, directions, distances):
+        """Casts many rays at once, requires NumPy
+
+        origins, directions: (n, 3) arrays, directions needn't be normalized
+        distances: (n,) array of finite distances
+        Returns (hit, distance, point, normal) arrays for each ray, distance is inf and point
+        and normal are 0 where a ray misses. Hits are the same as raycast's."""
+        if self.arrays is None:
+            self.build()
+        n = len(origins)
+        hit = np.zeros(n, dtype=bool)
+        hit_distances = np.full(n, np.inf)
+        normals = np.zeros((n, 3))
+        for start in range(0, n, RAY_BATCH_SIZE):
+            end = min(n, start + RAY_BATCH_SIZE)
+            hit[start:end], hit_distances[start:end], normals[start:end] = \
+                self.arrays.intersect_rays(origins[start:end], directions[start:end], distances[start:end])
+        lengths = np.linalg.norm(directions, axis=1)
+        unit = np.divide(directions, lengths[:, None], out=np.zeros_like(directions, dtype=float),
+                         where=lengths[:, None] > 0)
+        points = np.where(hit[:, None], origins + unit * np.where(hit, hit_distances, 0)[:, None], 0)
+        return hit, hit_distances, points, normals
+
+    def check_parity(self, num_rays=1000, max_distance=20, seed=0, tolerance=1e-3):
+        """Casts random rays through the world with both this and Ursina's raycast, returns a
+        list of (origin, direction, distance, reason) for rays where they disagree
+
+        Requires the zone's entities to be in the scene, and only works with nothing else with
+        a collider near the zone."""
+        from ursina import raycast
+        rng = random.Random(seed)
+        lower, upper = self.get_bounds()
+        mismatches = []
+        for _ in range(num_rays):
+            origin = Vec3(*(rng.uniform(lo - 1, hi + 1) for lo, hi in zip(lower, upper)))
+            direction = Vec3(rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1))
+            if direction == Vec3(0, 0, 0):
+                continue
+            distance = rng.uniform(0, max_distance)
+            reason = compare_hits(self.raycast(origin, direction, distance),
+                                  raycast(origin, direction=direction, distance=distance),
+                                  direction, tolerance)
+            if reason:
+                mismatches.append((origin, direction, distance, reason))
+        return mismatches
+
+    def get_bounds(self):
+        """Returns the (lower, upper) corners of the box around all colliders"""
+        if not self.boxes:
+            return ((0, 0, 0), (0, 0, 0))
+        lower = tuple(min(box.lower[i] for box in self.boxes) for i in range(3))
+        upper = tuple(max(box.upper[i] for box in self.boxes) for i in range(3))
+        return lower, upper
+
+
+class BVH:
+    """Bounding volume hierarchy over StaticBoxes, so a ray only tests the boxes near its path.
+
+    Each node bounds a run of boxes with an axis-aligned box, and is split in two at the
+    median of its boxes' centers along its longest axis until runs are at most BVH_LEAF_SIZE.
+    Nodes are kept in flat lists indexed by node number, with the root at 0."""
+    def __init__(self, boxes, leaf_size=BVH_LEAF_SIZE):
+        # Boxes reordered so every node's boxes are contiguous
+        self.boxes = list(boxes)
+        self.leaf_size = leaf_size
+        self.lower = []
+        self.upper = []
+        # Children of inner nodes, -1 for leaves
+        self.left = []
+        self.right = []
+        # Run of boxes in leaves, empty for inner nodes
+        self.start = []
+        self.count = []
+        if self.boxes:
+            self.build_node(0, len(self.boxes))
+
+    def build_node(self, start, end):
+        """Adds a node over boxes[start:end] and its descendants, returns its index"""
+        boxes = self.boxes[start:end]
+        i = len(self.lower)
+        self.lower.append(tuple(min(box.lower[axis] for box in boxes) for axis in range(3)))
+        self.upper.append(tuple(max(box.upper[axis] for box in boxes) for axis in range(3)))
+        self.left.append(-1)
+        self.right.append(-1)
+        self.start.append(start)
+        self.count.append(0)
+        if end - start <= self.leaf_size:
+            self.count[i] = end - start
+            return i
+        centers = [[box.center[axis] for box in boxes] for axis in range(3)]
+        axis = max(range(3), key=lambda axis: max(centers[axis]) - min(centers[axis]))
+        boxes.sort(key=lambda box: box.center[axis])
+        self.boxes[start:end] = boxes
+        middle = (start + end) // 2
+        self.left[i] = self.build_node(start, middle)
+        self.right[i] = self.build_node(middle, end)
+        return i
+
+    def intersect_ray(self, origin, direction, max_distance, margin=0):
+        """Returns (box, distance, world normal) for the first box hit by a ray, grown by margin,
+        or None if it misses within max_distance
+
+        direction must be normalized. Nearer children are visited first, and nodes further
+        than the closest hit so far are skipped."""
+        if not self.boxes:
+            return None
+        inverse = tuple(1 / d if abs(d) >= PARALLEL_EPSILON else math.inf for d in direction)
+        closest = None
+        entry = self.intersect_node(0, origin, inverse, max_distance, margin)
+        if entry is None:
+            return None
+        stack = [(entry, 0)]
+        while stack:
+            entry, i = stack.pop()
+            if entry > max_distance:
+                continue
+            count = self.count[i]
+            if count:
+                for box in self.boxes[self.start[i]:self.start[i] + count]:
+                    intersection = box.intersect_ray(origin, direction, max_distance, margin)
+                    if intersection is not None:
+                        max_distance, normal = intersection
+                        closest = (box, max_distance, normal)
+                continue
+            left = self.left[i]
+            right = self.right[i]
+            left_entry = self.intersect_node(left, origin, inverse, max_distance, margin)
+            right_entry = self.intersect_node(right, origin, inverse, max_distance, margin)
+            if left_entry is not None and right_entry is not None and left_entry < right_entry:
+                # Pushed last so it's visited first
+                stack.append((right_entry, right))
+                stack.append((left_entry, left))
+                continue
+            if left_entry is not None:
+                stack.append((left_entry, left))
+            if right_entry is not None:
+                stack.append((right_entry, right))
+        return closest
+
+    def intersect_node(self, i, origin, inverse, max_distance, margin):
+        """Returns the distance along a ray where it enters node i's bounds, 0 if it starts
+        inside, or None if it misses within max_distance"""
+        lower = self.lower[i]
+        upper = self.upper[i]
+        t_near = 0
+        t_far = max_distance
+        for axis in range(3):
+            o = origin[axis]
+            lo = lower[axis] - margin
+            hi = upper[axis] + margin
+            inv = inverse[axis]
+            if inv == math.inf:
+                if o < lo or o > hi:
+                    return None
+                continue
+            t1 = (lo - o) * inv
+            t2 = (hi - o) * inv
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > t_near:
+                t_near = t1
+            if t2 < t_far:
+                t_far = t2
+            if t_near > t_far:
+                return None
+        return t_near
+
+
+class BoxArrays:
+    """Structure of arrays copy of a BVH and its StaticBoxes, for testing many rays at once"""
+    def __init__(self, bvh):
+        boxes = bvh.boxes
+        self.num_boxes = len(boxes)
+        self.centers = np.array([box.center for box in boxes], dtype=float).reshape(-1, 3)
+        # axes[i, j] is box i's jth local axis
+        self.axes = np.array([box.axes for box in boxes], dtype=float).reshape(-1, 3, 3)
+        self.half_extents = np.array([box.half_extents for box in boxes], dtype=float).reshape(-1, 3)
+        self.node_lower = np.array(bvh.lower, dtype=float).reshape(-1, 3)
+        self.node_upper = np.array(bvh.upper, dtype=float).reshape(-1, 3)
+        self.node_left = np.array(bvh.left, dtype=int)
+        self.node_right = np.array(bvh.right, dtype=int)
+        self.node_start = np.array(bvh.start, dtype=int)
+        self.node_count = np.array(bvh.count, dtype=int)
+
+    def get_candidates(self, origins, unit, distances, rays):
+        """Returns (ray, box) index arrays pairing each of rays with the boxes in the BVH
+        leaves its segment passes through
+
+        Walks the BVH a level at a time for all rays together, keeping the (ray, node) pairs
+        whose segment crosses the node's bounds, the same test as BVH.intersect_node."""
+        nodes = np.zeros(len(rays), dtype=int)
+        parallel = np.abs(unit) < PARALLEL_EPSILON
+        inverse = 1 / np.where(parallel, 1, unit)
+        pair_rays = []
+        pair_boxes = []
+        while len(rays):
+            o = origins[rays]
+            t1 = (self.node_lower[nodes] - o) * inverse[rays]
+            t2 = (self.node_upper[nodes] - o) * inverse[rays]
+            ray_parallel = parallel[rays]
+            between = (o >= self.node_lower[nodes]) & (o <= self.node_upper[nodes])
+            t_min = np.where(ray_parallel, np.where(between, -np.inf, np.inf), np.minimum(t1, t2))
+            t_max = np.where(ray_parallel, np.inf, np.maximum(t1, t2))
+            t_near = np.maximum(t_min.max(axis=1), 0)
+            t_far = np.minimum(t_max.min(axis=1), distances[rays])
+            crossed = t_near <= t_far
+            rays = rays[crossed]
+            nodes = nodes[crossed]
+            counts = self.node_count[nodes]
+            leaf = counts > 0
+            if leaf.any():
+                leaf_counts = counts[leaf]
+                pair_rays.append(np.repeat(rays[leaf], leaf_counts))
+                # Consecutive box indices from each leaf's start
+                offsets = np.arange(leaf_counts.sum()) - np.repeat(np.cumsum(leaf_counts) - leaf_counts, leaf_counts)
+                pair_boxes.append(np.repeat(self.node_start[nodes[leaf]], leaf_counts) + offsets)
+            inner = ~leaf
+            rays = np.concatenate([rays[inner], rays[inner]])
+            nodes = np.concatenate([self.node_left[nodes[inner]], self.node_right[nodes[inner]]])
+        if not pair_rays:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        return np.concatenate(pair_rays), np.concatenate(pair_boxes)
+
+    def intersect_rays(self, origins, directions, distances):
+        """Returns (hit, distance, normal) arrays for the closest box hit by each ray
+
+        Rays are first paired with the boxes in the BVH leaves they reach, then the pairs
+        are tested exactly with the same slab test as StaticBox.intersect_ray."""
+        n = len(origins)
+        hit = np.zeros(n, dtype=bool)
+        hit_distances = np.full(n, np.inf)
+        normals = np.zeros((n, 3))
+        lengths = np.linalg.norm(directions, axis=1)
+        valid = lengths > 0
+        if not self.num_boxes or not valid.any():
+            return hit, hit_distances, normals
+        unit = np.zeros((n, 3))
+        unit[valid] = directions[valid] / lengths[valid, None]
+        rays, boxes = self.get_candidates(origins, unit, distances, np.flatnonzero(valid))
+        if not len(rays):
+            return hit, hit_distances, normals
+        axes = self.axes[boxes]
+        half_extents = self.half_extents[boxes]
+        # Ray origins and directions in each box's local space
+        p = np.einsum("pj,pkj->pk", origins[rays] - self.centers[boxes], axes)
+        d = np.einsum("pj,pkj->pk", unit[rays], axes)
+        parallel = np.abs(d) < PARALLEL_EPSILON
+        outside = (parallel & (np.abs(p) > half_extents)).any(axis=1)
+        safe_d = np.where(parallel, 1, d)
+        t1 = (-half_extents - p) / safe_d
+        t2 = (half_extents - p) / safe_d
+        t_min = np.where(parallel, -np.inf, np.minimum(t1, t2))
+        t_max = np.where(parallel, np.inf, np.maximum(t1, t2))
+        near_axis = t_min.argmax(axis=1)
+        t_near = t_min.max(axis=1)
+        t_far = t_max.min(axis=1)
+        inside = t_near < 0
+        pair_hit = ~outside & (t_near <= t_far) & (t_far >= 0) & (t_near <= distances[rays]) \
+            & (~inside | (t_far <= distances[rays]))
+        index = np.arange(len(rays))
+        # Moving along an axis enters through the face on its negative side
+        sign = np.where(d[index, near_axis] > 0, -1.0, 1.0)
+        if inside.any():
+            # Starts inside, hits where it leaves through the face on the positive side
+            far_axis = t_max.argmin(axis=1)
+            near_axis = np.where(inside, far_axis, near_axis)
+            sign = np.where(inside, np.where(d[index, far_axis] > 0, 1.0, -1.0), sign)
+            t_near = np.where(inside, t_far, t_near)
+        pair_normals = axes[index, near_axis] * sign[:, None]
+        # Closest hit pair of each ray
+        t_near = np.where(pair_hit, t_near, np.inf)
+        order = np.lexsort((t_near, rays))
+        first_rays, first = np.unique(rays[order], return_index=True)
+        closest = order[first]
+        found = pair_hit[closest]
+        first_rays = first_rays[found]
+        closest = closest[found]
+        hit[first_rays] = True
+        hit_distances[first_rays] = t_near[closest]
+        normals[first_rays] = pair_normals[closest]
+        return hit, hit_distances, normals
+
+
+class StaticBox:
+    """An oriented box collider that never moves"""
+    def __init__(self, name, position, rotation, scale, center, half_extents):
+        """position, rotation, scale: the entity's transform, rotation in Ursina's degrees
+        center, half_extents: the box in the entity's local space, before scaling"""
+        self.name = name
+        # Same as the entity's position, so hits can be treated like Ursina's HitInfo.entity
+        self.position = Vec3(*position)
+        right, up, forward = get_axes(rotation)
+        self.axes = (right, up, forward)
+        self.half_extents = tuple(abs(h * s) for h, s in zip(half_extents, scale))
+        local_center = [c * s for c, s in zip(center, scale)]
+        self.center = tuple(position[i] + sum(axis[i] * c for axis, c in zip(self.axes, local_center))
+                            for i in range(3))
+        # Axis-aligned bounds of the rotated box
+        extent = [sum(abs(axis[i]) * h for axis, h in zip(self.axes, self.half_extents))
+                  for i in range(3)]
+        self.lower = tuple(c - e for c, e in zip(self.center, extent))
+        self.upper = tuple(c + e for c, e in zip(self.center, extent))
+
+    def intersect_ray(self, origin, direction, max_distance, margin=0):
+        """Returns (distance, world normal) where a ray first hits the box grown by margin, or
+        None if it misses within max_distance
+
+        direction must be normalized. Like Panda3D's CollisionBox, a ray starting inside hits
+        where it leaves the box, with the normal of that face."""
+        offset = (origin[0] - self.center[0], origin[1] - self.center[1], origin[2] - self.center[2])
+        t_near = -math.inf
+        t_far = math.inf
+        near_axis = None
+        near_sign = 0
+        far_axis = None
+        far_sign = 0
+        for axis, half_extent in zip(self.axes, self.half_extents):
+            half_extent += margin
+            p = offset[0] * axis[0] + offset[1] * axis[1] + offset[2] * axis[2]
+            d = direction[0] * axis[0] + direction[1] * axis[1] + direction[2] * axis[2]
+            if abs(d) < PARALLEL_EPSILON:
+                if abs(p) > half_extent:
+                    return None
+                continue
+            t1 = (-half_extent - p) / d
+            t2 = (half_extent - p) / d
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > t_near:
+                t_near = t1
+                near_axis = axis
+                # Moving along the axis enters through the face on its negative side
+                near_sign = -1 if d > 0 else 1
+            if t2 < t_far:
+                t_far = t2
+                far_axis = axis
+                # and leaves through the face on its positive side
+                far_sign = 1 if d > 0 else -1
+            if t_near > t_far or t_far < 0 or t_near > max_distance:
+                return None
+        if near_axis is None:
+            # Parallel to every face yet inside, only possible for a degenerate direction
+            return None
+        if t_near < 0:
+            # Starts inside
+            if t_far > max_distance:
+                return None
+            return t_far, tuple(a * far_sign for a in far_axis)
+        return t_near, tuple(a * near_sign for a in near_axis)
+
+
+class RayHit:
+    """Result of a CollisionWorld query, with the same attribute names as Ursina's HitInfo"""
+    def __init__(self, hit, entity=None, distance=math.inf, world_point=None, world_normal=None):
+        self.hit = hit
+        self.entity = entity
+        self.distance = distance
+        self.world_point = world_point
+        self.world_normal = world_normal
+
+
+def get_axes(rotation):
+    """Returns the world (right, up, forward) axes of an entity with Ursina rotation in degrees
+
+    Ursina rotates positive x nose down, positive y clockwise seen from above and positive z
+    clockwise seen from behind, applying z, then x, then y."""
+    rx, ry, rz = (math.radians(r) for r in rotation)
+    cx, sx = math.cos(rx), math.sin(rx)
+    cy, sy = math.cos(ry), math.sin(ry)
+    cz, sz = math.cos(rz), math.sin(rz)
+
+    def rotate(v):
+        x, y, z = v
+        # Roll
+        x, y = x * cz + y * sz, -x * sz + y * cz
+        # Pitch
+        y, z = y * cx - z * sx, y * sx + z * cx
+        # Yaw
+        x, z = x * cy + z * sy, -x * sy + z * cy
+        return (x, y, z)
+
+    return rotate((1, 0, 0)), rotate((0, 1, 0)), rotate((0, 0, 1))
+
+
+def get_vec(data, name, default):
+    """Reads a vector kwarg from zone json, which may be a list, a single number for all
+    components, or separate name_x, name_y, name_z keys"""
+    value = data.get(name, default)
+    if isinstance(value, (int, float)):
+        value = [value] * 3
+    value = list(value) + [default] * (3 - len(value))
+    for i, suffix in enumerate("xyz"):
+        value[i] = data.get(f"{name}_{suffix}", value[i])
+    return value
+
+
+def compare_hits(hit, ursina_hit, direction, tolerance):
+    """Returns why a RayHit differs from Ursina's HitInfo, or an empty string if they agree
+
+    Panda3D intersects in 32 bit floats. A ray at a grazing angle to a face moves the hit
+    point along the ray by the face's rounding error over the angle's cosine, so the
+    tolerance for the point is scaled by that, up to MAX_GRAZING_SCALE. Panda3D occasionally
+    reports a hit with a zero normal, those normals aren't compared."""
+    if hit.hit != ursina_hit.hit:
+        return f"hit {hit.hit}, Ursina hit {ursina_hit.hit}"
+    if not hit.hit:
+        return ""
+    cosine = abs(direction.normalized().dot(hit.world_normal))
+    point_tolerance = tolerance * min(1 / max(cosine, 1e-9), MAX_GRAZING_SCALE)
+    if (hit.world_point - ursina_hit.world_point).length() > point_tolerance:
+        return f"point {hit.world_point}, Ursina point {ursina_hit.world_point}"
+    if ursina_hit.world_normal != Vec3(0, 0, 0) \
+            and (hit.world_normal - ursina_hit.world_normal).length() > tolerance:
+        return f"normal {hit.world_normal}, Ursina normal {ursina_hit.world_normal}"
+    return ""
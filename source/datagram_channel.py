@@ -0,0 +1,238 @@
+"""Unreliable UDP channel for state which is only useful when fresh, like movement snapshots.
+
+RPCPeer is a reliable ordered TCP stream, so a single lost packet holds back every newer
+position behind it. The DatagramChannel instead sends RPCs as individual datagrams, which
+are handled by the same @rpc functions as the reliable channel. Each datagram carries a
+tick, and the receiver drops datagrams for an RPC which are older than the newest one it
+has already handled, so late snapshots never overwrite newer ones.
+
+The server binds a UDP socket on the same port as its RPCPeer. When a client connects,
+the server sends it a random token over the reliable channel, and the client sends hello
+datagrams containing the token until it receives its first datagram back. The server
+then knows which address belongs to which connection. Until then, or if UDP is blocked,
+Network.send_unreliable falls back to the reliable channel.
+
+Datagrams are parsed before their RPC is called, and dropped if they're malformed, rather
+than handed to RPCPeer.rpc_on_data, which disconnects the reliable channel on a bad RPC.
+Anyone can send a UDP packet from a spoofed address, and a truncated datagram is no reason
+to lose the connection."""
+import secrets
+import socket
+import struct
+import time
+
+from panda3d.core import Datagram
+from ursina import Entity
+from ursina.networking import procedure_hash
+
+# Larger datagrams risk IP fragmentation, where losing any fragment loses the whole datagram
+MAX_DATAGRAM_SIZE = 1200
+HELLO_INTERVAL = 0.5
+
+HELLO = 0
+DATA = 1
+# Kind and tick, DATA is followed by an RPC in the same format as RPCPeer's
+header_struct = struct.Struct("<BI")
+token_struct = struct.Struct("<q")
+# DatagramWriter.write_int32 is big-endian
+hash_struct = struct.Struct(">i")
+
+
+def is_newer_or_equal(tick, last_tick):
+    """Compares ticks as 32 bit serial numbers, so they can wrap around"""
+    return (tick - last_tick) & 0xFFFFFFFF < 0x80000000
+
+
+class DatagramChannel(Entity):
+    def __init__(self, rpc_peer):
+        """rpc_peer: the RPCPeer whose types and procedures datagrams are serialized with"""
+        super().__init__()
+        self.rpc_peer = rpc_peer
+        self.socket = None
+        self.is_host = False
+
+        self.connection_to_address = dict()
+        self.address_to_connection = dict()
+        # Server only, maps the token sent to each connection to that connection
+        self.token_to_connection = dict()
+        # Client only, the token to send in hellos until the server replies
+        self.hello_token = None
+        self.server_address = None
+        self.last_hello_time = 0
+
+        # Maps connection to procedure hash to newest tick handled
+        self.connection_to_last_ticks = dict()
+        # NetworkSimulator incoming datagrams go through, if any, which pumps itself
+        self.simulator = None
+
+        self.num_stale = 0
+        self.num_oversized = 0
+        self.num_malformed = 0
+
+    def start(self, host_name, port, is_host=False):
+        """Server binds to the same port as its RPCPeer. Clients start in bind_server."""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if is_host:
+            self.socket.bind((host_name, port))
+        self.socket.setblocking(False)
+        self.is_host = is_host
+
+    def stop(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def is_bound(self, connection):
+        """Whether datagrams can be sent to connection"""
+        return self.socket is not None and connection in self.connection_to_address
+
+    def make_token(self, connection):
+        """Server: makes the token a connection's client should send to bind its address"""
+        token = secrets.randbits(62)
+        self.token_to_connection[token] = connection
+        return token
+
+    def bind_server(self, connection, token):
+        """Client: starts sending hellos to the server connected to by connection"""
+        if self.socket is None:
+            self.start(None, None)
+        self.hello_token = token
+        host_name, port = connection.address
+        # recvfrom reports numeric addresses, so resolve names like localhost to match them
+        self.server_address = (socket.gethostbyname(host_name), port)
+        self.connection_to_address[connection] = self.server_address
+        self.address_to_connection[self.server_address] = connection
+        self.send_hello()
+
+    def send_hello(self):
+        self.last_hello_time = time.time()
+        packet = header_struct.pack(HELLO, 0) + token_struct.pack(self.hello_token)
+        try:
+            self.socket.sendto(packet, self.server_address)
+        except OSError:
+            pass
+
+    def send(self, connection, tick, name, *args):
+        """Sends an RPC to connection as a single datagram. Returns False if it wasn't sent.
+
+        tick: identifies which update this is part of, datagrams for the same RPC with a
+        lower tick than one already handled are dropped"""
+        if not self.is_bound(connection) or (not self.is_host and self.hello_token is not None):
+            return False
+        writer = self.rpc_peer.writer
+        writer.clear()
+        writer.write_int32(procedure_hash(name))
+        for arg in args:
+            writer.write(arg)
+        packet = header_struct.pack(DATA, tick & 0xFFFFFFFF) + writer.get_datagram().getMessage()
+        if len(packet) > MAX_DATAGRAM_SIZE:
+            self.num_oversized += 1
+            return False
+        try:
+            self.socket.sendto(packet, self.connection_to_address[connection])
+        except OSError:
+            return False
+        if hasattr(self.rpc_peer, "stats"):
+            self.rpc_peer.stats.record_send(connection, name, len(packet))
+        return True
+
+    def update(self):
+        if self.socket is None:
+            return
+        now = time.time()
+        while True:
+            try:
+                packet, address = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # ICMP port unreachable shows up as an error on the next recvfrom on some platforms
+                continue
+            self.receive(packet, address, now)
+        if self.hello_token is not None and now - self.last_hello_time >= HELLO_INTERVAL:
+            self.send_hello()
+
+    def receive(self, packet, address, time_received):
+        if len(packet) < header_struct.size:
+            return
+        kind, tick = header_struct.unpack_from(packet)
+        if kind == HELLO:
+            if self.is_host and len(packet) == header_struct.size + token_struct.size:
+                self.handle_hello(token_struct.unpack_from(packet, header_struct.size)[0], address)
+            return
+        connection = self.address_to_connection.get(address)
+        if connection is None:
+            return
+        # The server replying means it has our address
+        self.hello_token = None
+        if self.simulator is not None:
+            self.simulator.receive(connection, packet, time_received)
+        else:
+            self.deliver(connection, packet, time_received)
+
+    def handle_hello(self, token, address):
+        connection = self.token_to_connection.get(token)
+        if connection is None:
+            return
+        old_address = self.connection_to_address.get(connection)
+        if old_address is not None:
+            self.address_to_connection.pop(old_address, None)
+        self.connection_to_address[connection] = address
+        self.address_to_connection[address] = connection
+
+    def deliver(self, connection, packet, time_received):
+        """Handles a datagram's RPC, unless a newer one for the same RPC was already handled
+
+        Every well-formed datagram is recorded in the RPCPeer's stats if it has them, stale
+        ones included, since they did arrive"""
+        start = time.perf_counter()
+        _, tick = header_struct.unpack_from(packet)
+        data = packet[header_struct.size:]
+        if len(data) < hash_struct.size:
+            return
+        call = self.parse(data)
+        if call is None:
+            self.num_malformed += 1
+            return
+        proc_hash, proc, args = call
+        name, _, proc_func, host_only, client_only = proc
+        last_ticks = self.connection_to_last_ticks.setdefault(connection, dict())
+        if proc_hash in last_ticks and not is_newer_or_equal(tick, last_ticks[proc_hash]):
+            self.num_stale += 1
+        else:
+            last_ticks[proc_hash] = tick
+            if not (client_only if self.rpc_peer.is_hosting() else host_only):
+                proc_func(connection, time_received, *args)
+        if hasattr(self.rpc_peer, "stats"):
+            us = (time.perf_counter() - start) * 1e6
+            self.rpc_peer.stats.record_receive(connection, name, len(packet), us)
+
+    def parse(self, data):
+        """Returns (procedure hash, procedure, args) of a datagram's RPC, or None if it's for
+        an unknown procedure, is truncated, or has bytes left over"""
+        proc_hash = hash_struct.unpack_from(data)[0]
+        proc = self.rpc_peer.procedures.get(proc_hash)
+        if proc is None:
+            return None
+        reader = self.rpc_peer.reader
+        try:
+            reader.set_datagram(Datagram(data))
+            reader.read_int32()
+            args = [reader.read(t, max_list_length=self.rpc_peer.max_list_length) for t in proc[1]]
+        except Exception:
+            return None
+        if reader.iter.getRemainingSize():
+            return None
+        return proc_hash, proc, args
+
+    def remove_connection(self, connection):
+        """Forgets a connection which disconnected"""
+        address = self.connection_to_address.pop(connection, None)
+        if address is not None:
+            self.address_to_connection.pop(address, None)
+        self.connection_to_last_ticks.pop(connection, None)
+        for token, token_connection in list(self.token_to_connection.items()):
+            if token_connection == connection:
+                del self.token_to_connection[token]
+        if self.simulator is not None:
+            self.simulator.remove_connection(connection)
@@ -0,0 +1,144 @@
+"""Simulates bad network conditions on localhost.
+
+A NetworkSimulator sits between a transport and the code that handles its incoming
+messages, and holds each message back for a random latency before delivering it. It's
+installed on the receiving side, so to simulate both directions, install one in both the
+client and the server. All randomness comes from a seeded random.Random, so a run with
+the same seed and the same traffic drops and delays the same messages.
+
+    network.simulate_conditions(seed=1, latency=0.1, jitter=0.02, loss=0.01)
+
+server.py, main.py and main_multiplayer.py do this when the NETSIM environment variable is
+set, with the same arguments separated by commas. main.py's server inherits it:
+
+    NETSIM=seed=1,latency=0.1,jitter=0.02,loss=0.01 python main.py
+
+RPCPeer is a reliable ordered stream, so on it a lost message is delayed by a
+retransmission timeout rather than dropped, and messages can't overtake each other.
+Unreliable channels really drop and reorder messages."""
+import heapq
+import os
+import random
+import time
+
+from ursina import Entity
+
+# Environment variable read by conditions_from_env
+CONDITIONS_ENV_VAR = "NETSIM"
+# Arguments of NetworkSimulator that can be given in CONDITIONS_ENV_VAR, and their types
+CONDITION_TYPES = {
+    "seed": int,
+    "latency": float,
+    "jitter": float,
+    "loss": float,
+    "reorder": float,
+    "retransmit_delay": float,
+}
+
+
+def parse_conditions(spec):
+    """Returns NetworkSimulator kwargs from a string like seed=1,latency=0.1,loss=0.01"""
+    conditions = dict()
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in CONDITION_TYPES:
+            raise ValueError(f"Unknown network condition {name!r}, expected one of "
+                             f"{', '.join(CONDITION_TYPES)}")
+        conditions[name] = CONDITION_TYPES[name](value)
+    return conditions
+
+
+def conditions_from_env():
+    """Returns NetworkSimulator kwargs from CONDITIONS_ENV_VAR, or None if it isn't set"""
+    spec = os.environ.get(CONDITIONS_ENV_VAR)
+    if spec is None:
+        return None
+    return parse_conditions(spec)
+
+
+class NetworkSimulator(Entity):
+    def __init__(self, deliver, reliable=True, seed=0, latency=0.0, jitter=0.0, loss=0.0,
+                 reorder=0.0, retransmit_delay=0.2):
+        """deliver: function taking (connection, data, time_received) which handles a message
+        reliable: whether the simulated transport is reliable and ordered
+        seed: seed for all random decisions
+        latency: seconds each message is delayed by
+        jitter: maximum seconds randomly added to latency
+        loss: probability of a message being lost
+        reorder: probability of an unreliable message being held back by another latency,
+        so newer messages overtake it
+        retransmit_delay: seconds added to a lost reliable message"""
+        super().__init__()
+        self.deliver = deliver
+        self.reliable = reliable
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.retransmit_delay = retransmit_delay
+        # Heap of (delivery time, arrival counter, connection, data)
+        self.queue = []
+        self.counter = 0
+        # Delivery time of the last message from each connection, reliable messages can't beat it
+        self.connection_to_last_delivery = dict()
+
+        self.num_received = 0
+        self.num_delivered = 0
+        self.num_dropped = 0
+        self.num_retransmitted = 0
+        self.num_reordered = 0
+
+    @classmethod
+    def install(cls, rpc_peer, **kwargs):
+        """Makes a simulator that delays all messages an RPCPeer receives before handling them"""
+        peer = rpc_peer.peer
+        simulator = cls(peer.on_data, reliable=True, **kwargs)
+        peer.on_data = simulator.receive
+        on_disconnect = peer.on_disconnect
+
+        def simulated_on_disconnect(connection, time_received):
+            simulator.remove_connection(connection)
+            on_disconnect(connection, time_received)
+
+        peer.on_disconnect = simulated_on_disconnect
+        return simulator
+
+    def receive(self, connection, data, time_received):
+        """Queues a message which just arrived from the real transport"""
+        self.num_received += 1
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if self.rng.random() < self.loss:
+            if not self.reliable:
+                self.num_dropped += 1
+                return
+            delay += self.retransmit_delay
+            self.num_retransmitted += 1
+        elif not self.reliable and self.rng.random() < self.reorder:
+            delay += self.latency
+            self.num_reordered += 1
+        delivery_time = time_received + delay
+        if self.reliable:
+            delivery_time = max(delivery_time, self.connection_to_last_delivery.get(connection, 0))
+            self.connection_to_last_delivery[connection] = delivery_time
+        heapq.heappush(self.queue, (delivery_time, self.counter, connection, data))
+        self.counter += 1
+
+    def update(self):
+        self.pump(time.time())
+
+    def pump(self, now):
+        """Delivers all messages due by now, with their delivery time as time_received"""
+        while self.queue and self.queue[0][0] <= now:
+            delivery_time, _, connection, data = heapq.heappop(self.queue)
+            self.num_delivered += 1
+            self.deliver(connection, data, delivery_time)
+
+    def remove_connection(self, connection):
+        """Discards messages held for a connection which disconnected"""
+        self.queue = [item for item in self.queue if item[2] != connection]
+        heapq.heapify(self.queue)
+        self.connection_to_last_delivery.pop(connection, None)
@@ -0,0 +1,179 @@
+"""Per-RPC network instrumentation.
+
+InstrumentedRPCPeer is a drop-in RPCPeer which records, for each RPC name and each
+connection, the number of messages sent and received, their serialized sizes, and how
+long incoming calls take to deserialize and run. Query the results with
+NetStats.snapshot, or set NetStats.dump_interval to print them periodically."""
+import struct
+import time
+
+from ursina.networking import RPCPeer
+
+# Handler times are bucketed by powers of two of microseconds, the last bucket
+# holds everything from 2**(NUM_TIME_BUCKETS - 2) us (about 1 second) up
+NUM_TIME_BUCKETS = 22
+# Procedure hash at the start of every RPC, DatagramWriter.write_int32 is big-endian
+hash_struct = struct.Struct(">i")
+
+
+class Histogram:
+    """Log2 histogram of durations in microseconds"""
+    def __init__(self):
+        self.buckets = [0] * NUM_TIME_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, us):
+        self.buckets[min(int(us).bit_length(), NUM_TIME_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += us
+        self.max = max(self.max, us)
+
+    def percentile(self, p):
+        """Returns an upper bound on the p-th percentile, from the bucket it falls in"""
+        if self.count == 0:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return float(min(2 ** i, self.max))
+        return float(self.max)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count if self.count else 0.0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            "max_us": self.max,
+            "buckets": list(self.buckets),
+        }
+
+
+class RPCStats:
+    """Counters for a single RPC name, either overall or on a single connection"""
+    def __init__(self):
+        self.sent = 0
+        self.sent_bytes = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.handler_time = Histogram()
+
+    def snapshot(self):
+        return {
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "received": self.received,
+            "received_bytes": self.received_bytes,
+            "handler_time": self.handler_time.snapshot(),
+        }
+
+
+class NetStats:
+    """Collects RPCStats by RPC name, and by connection and RPC name"""
+    def __init__(self):
+        self.name_to_stats = dict()
+        self.connection_to_stats = dict()
+        self.start_time = time.perf_counter()
+        # Seconds between printing the stats, None to never print them
+        self.dump_interval = None
+        self.last_dump_time = self.start_time
+
+    def get_stats(self, connection, name):
+        """Returns the overall and per connection RPCStats for name"""
+        stats = self.name_to_stats.get(name)
+        if stats is None:
+            stats = self.name_to_stats[name] = RPCStats()
+        conn_stats = self.connection_to_stats.setdefault(connection, dict())
+        if name not in conn_stats:
+            conn_stats[name] = RPCStats()
+        return stats, conn_stats[name]
+
+    def record_send(self, connection, name, num_bytes):
+        for stats in self.get_stats(connection, name):
+            stats.sent += 1
+            stats.sent_bytes += num_bytes
+
+    def record_receive(self, connection, name, num_bytes, us):
+        for stats in self.get_stats(connection, name):
+            stats.received += 1
+            stats.received_bytes += num_bytes
+            stats.handler_time.add(us)
+
+    def get_num_received(self, name):
+        """Returns the total messages received for an RPC name"""
+        stats = self.name_to_stats.get(name)
+        return stats.received if stats is not None else 0
+
+    def remove_connection(self, connection):
+        """Forgets the per connection stats for a connection, overall stats are kept"""
+        self.connection_to_stats.pop(connection, None)
+
+    def reset(self):
+        self.name_to_stats.clear()
+        self.connection_to_stats.clear()
+        self.start_time = time.perf_counter()
+
+    def snapshot(self):
+        """Returns all stats as plain dicts. Connections are keyed by their address."""
+        return {
+            "elapsed": time.perf_counter() - self.start_time,
+            "rpcs": {name: stats.snapshot() for name, stats in self.name_to_stats.items()},
+            "connections": {
+                str(connection.address): {name: stats.snapshot() for name, stats in conn_stats.items()}
+                for connection, conn_stats in self.connection_to_stats.items()
+            },
+        }
+
+    def format(self):
+        """Returns a table of the overall stats, RPCs sorted by total bytes"""
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        lines = [f"{'rpc':<28}{'sent':>8}{'recv':>8}{'bytes/s':>10}{'p50 us':>9}{'p99 us':>9}{'max us':>9}"]
+        by_bytes = sorted(self.name_to_stats.items(),
+                          key=lambda item: item[1].sent_bytes + item[1].received_bytes, reverse=True)
+        for name, stats in by_bytes:
+            hist = stats.handler_time
+            rate = (stats.sent_bytes + stats.received_bytes) / elapsed
+            lines.append(f"{name:<28}{stats.sent:>8}{stats.received:>8}{rate:>10.0f}"
+                         f"{hist.percentile(50):>9.0f}{hist.percentile(99):>9.0f}{hist.max:>9.0f}")
+        return "\n".join(lines)
+
+    def update(self):
+        """Prints the stats if dump_interval has passed since they were last printed"""
+        if self.dump_interval is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_dump_time >= self.dump_interval:
+            self.last_dump_time = now
+            print(self.format())
+
+
+class InstrumentedRPCPeer(RPCPeer):
+    """RPCPeer which records every RPC it sends and receives in self.stats"""
+    def __init__(self, *args, **kwargs):
+        # Set before RPCPeer.__init__ so that looking it up never falls through to __getattr__
+        self.stats = NetStats()
+        super().__init__(*args, **kwargs)
+
+    def __getattr__(self, name):
+        remote_procedure = super().__getattr__(name)
+
+        def instrumented_procedure(*args):
+            remote_procedure(*args)
+            self.stats.record_send(args[0], name, self.writer.get_datagram().getLength())
+
+        return instrumented_procedure
+
+    def rpc_on_data(self, connection, data, time_received):
+        start = time.perf_counter()
+        super().rpc_on_data(connection, data, time_received)
+        us = (time.perf_counter() - start) * 1e6
+        name = None
+        if len(data) >= hash_struct.size:
+            proc = self.procedures.get(hash_struct.unpack_from(data)[0])
+            if proc is not None:
+                name = proc[0]
+        self.stats.record_receive(connection, name or "<unknown>", len(data), us)
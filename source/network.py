@@ -1,21 +1,49 @@
 from ursina import *
-from ursina.networking import RPCPeer, rpc
+from ursina.networking import rpc
 
+from .clock import ClockSync
+from .datagram_channel import DatagramChannel
+from .netsim import NetworkSimulator, conditions_from_env
+from .netstats import InstrumentedRPCPeer
 from .states import *
 
 UPDATE_RATE = 1 / 20
+# Most game events sent to a connection in a single RPC
+MAX_EVENT_BATCH = 100
 
 class Network(Entity):
     """Represents a peer's interface into the network state"""
     def __init__(self):
         super().__init__()
-        self.peer = RPCPeer(max_list_length=1000)
+        self.peer = InstrumentedRPCPeer(max_list_length=1000)
+        # Per RPC traffic and handler timings, see netstats.py
+        self.stats = self.peer.stats
+        # Unreliable channel for state that's only useful when fresh, see datagram_channel.py
+        self.datagrams = DatagramChannel(self.peer)
 
         self.connection_to_uuid = dict()
         self.uuid_to_connection = dict()
 
         self.server_connection = None
         self.my_uuid = None
+        # NetworkSimulator delaying incoming messages, if simulate_conditions was called
+        self.simulator = None
+        # Client's estimate of the server's clock, see clock.py
+        self.clock = ClockSync()
+        # Server's record of the smoothed round trip time each client measured
+        self.connection_to_rtt = dict()
+        # Ids of snapshot datagrams the client handled since it last acknowledged them
+        self.snapshot_acks = []
+
+        # Maps connection to uuid to the last combat state sent for that character. Since RPCPeer
+        # is a reliable ordered stream, the last sent state is the baseline the client will hold
+        # by the time it receives the next delta.
+        self.connection_to_cbstate_baselines = dict()
+        # Maps uuid to the connections which can see that character, maintained by the
+        # server's InterestManager
+        self.uuid_to_observers = dict()
+        # GameEvents queued for each connection, sent together once per update
+        self.connection_to_events = dict()
 
         self.peer.register_type(LoginState, LoginState.serialize, LoginState.deserialize)
         self.peer.register_type(PCSpawnState, PCSpawnState.serialize, PCSpawnState.deserialize)
@@ -23,10 +51,66 @@ class Network(Entity):
         self.peer.register_type(PlayerCombatState, PlayerCombatState.serialize, PlayerCombatState.deserialize)
         self.peer.register_type(NPCCombatState, NPCCombatState.serialize, NPCCombatState.deserialize)
         self.peer.register_type(Stats, Stats.serialize, Stats.deserialize)
+        self.peer.register_type(SnapshotState, SnapshotState.serialize, SnapshotState.deserialize)
+        self.peer.register_type(GameEvent, GameEvent.serialize, GameEvent.deserialize)
 
     @every(UPDATE_RATE)
     def fixed_update(self):
+        if self.peer.is_hosting():
+            # The server's ServerTicker updates the peer in order with its systems
+            return
+        if self.server_connection is not None and self.clock.needs_ping():
+            self.peer.request_clock_ping(self.server_connection, self.clock.make_ping(),
+                                         float(self.clock.rtt or 0), self.stats.get_num_received("update_snapshot"))
+        if self.server_connection is not None and self.snapshot_acks:
+            self.peer.request_ack_snapshots(self.server_connection, self.snapshot_acks)
+            self.snapshot_acks = []
         self.peer.update()
+        self.stats.update()
+
+    def server_time(self):
+        """Returns the client's estimate of the current time on the server's clock"""
+        return self.clock.server_time()
+
+    def get_rtt(self, connection):
+        """Returns the round trip time to a client in seconds, or None if it hasn't measured it yet"""
+        return self.connection_to_rtt.get(connection)
+
+    def simulate_conditions(self, **kwargs):
+        """Delays and loses incoming messages to test under realistic network conditions.
+        kwargs are passed to NetworkSimulator, call before starting the peer."""
+        self.simulator = NetworkSimulator.install(self.peer, **kwargs)
+        self.datagrams.simulator = NetworkSimulator(self.datagrams.deliver, reliable=False, **kwargs)
+
+    def simulate_conditions_from_env(self):
+        """Calls simulate_conditions with the conditions in the NETSIM environment variable,
+        if it's set, see netsim.py. Call before starting the peer."""
+        conditions = conditions_from_env()
+        if conditions is not None:
+            self.simulate_conditions(**conditions)
+            print(f"Simulating network conditions {conditions}")
+
+    def send_unreliable(self, connection, tick, name, *args):
+        """Calls an RPC function over the datagram channel, or over the reliable channel if
+        the connection's datagram address isn't known yet
+
+        tick: increases with each update, the client ignores updates older than one it's handled
+        name: name of the RPC function"""
+        if not self.datagrams.send(connection, tick, name, *args):
+            getattr(self.peer, name)(connection, *args)
+
+    def queue_event(self, connection, event):
+        """Queues a GameEvent to be printed to a connection's game window.
+        Queued events are sent as one RPC per connection by flush_events, which the server's
+        ticker calls every tick."""
+        self.connection_to_events.setdefault(connection, []).append(event)
+
+    def flush_events(self):
+        """Sends all queued events"""
+        for connection, events in self.connection_to_events.items():
+            for i in range(0, len(events), MAX_EVENT_BATCH):
+                self.peer.remote_game_events(connection, events[i:i + MAX_EVENT_BATCH])
+        self.connection_to_events.clear()
 
     def broadcast(self, func, *args):
         """Calls an RPC function for each connection to host
@@ -37,13 +121,38 @@ class Network(Entity):
                 func(connection, *args)
 
     def broadcast_cbstate_update(self, char):
+        """Sends the fields of char's combat state that changed since each connection's baseline"""
         pc_state = PlayerCombatState(char)
         npc_state = NPCCombatState(char)
-        for connection, uuid in self.connection_to_uuid.items():
+        for connection in self.get_observers(char.uuid):
+            uuid = self.connection_to_uuid.get(connection)
+            baselines = self.connection_to_cbstate_baselines.setdefault(connection, dict())
+            state = pc_state if uuid == char.uuid else npc_state
+            delta = state.get_delta(baselines.get(char.uuid))
+            if len(delta) == 0:
+                continue
+            baselines[char.uuid] = state
             if uuid == char.uuid:
-                self.peer.update_pc_cbstate(connection, pc_state)
+                self.peer.update_pc_cbstate(connection, delta)
             else:
-                self.peer.update_npc_cbstate(connection, char.uuid, npc_state)
+                self.peer.update_npc_cbstate(connection, char.uuid, delta)
+
+    def get_observers(self, uuid):
+        """Returns the connections which can see the character with this uuid"""
+        return self.uuid_to_observers.get(uuid, ())
+
+    def set_cbstate_baseline(self, connection, char):
+        """Records the combat state that a connection received for char when spawning it"""
+        baselines = self.connection_to_cbstate_baselines.setdefault(connection, dict())
+        if self.connection_to_uuid.get(connection) == char.uuid:
+            baselines[char.uuid] = PlayerCombatState(char)
+        else:
+            baselines[char.uuid] = NPCCombatState(char)
+
+    def clear_cbstate_baselines(self, uuid):
+        """Forgets all baselines for a character, for example after it's destroyed"""
+        for baselines in self.connection_to_cbstate_baselines.values():
+            baselines.pop(uuid, None)
 
 
 # RPC needs to know about network at compile time, so this global seems necessary
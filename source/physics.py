@@ -4,12 +4,22 @@ from ursina import *
 from .base import PHYSICS_UPDATE_RATE, sqnorm, dot
 
 dt = PHYSICS_UPDATE_RATE
+GRAVITY = 100
+JUMP_SPEED = 25
+# Surfaces with normals pointing up less than this are walls, the rest are floors/slopes
+WALL_NORMAL_Y = 0.2
+# How far below a grounded character the ground is looked for before it starts falling
+GROUND_RAY_DISTANCE = 0.2
+# Height above the ground a falling character lands at
+LANDING_OFFSET = 1e-3
+# Static geometry that characters collide with instead of the scene's colliders, see set_collision_world
+_collision_world = None
 
 # PUBLIC
 def char_start_jump(char):
     if char.grounded:
         char.grounded = False
-        char.velocity_components["jump"] = Vec3(0, 25, 0)
+        char.velocity_components["jump"] = Vec3(0, JUMP_SPEED, 0)
 
 def char_end_jump(char):
     """Set jumping velocity to zero"""
@@ -19,7 +29,7 @@ def set_gravity_vel(char):
     """If not grounded and not jumping, subtract y from velocity vector"""
     grav = char.velocity_components.get("gravity", Vec3(0, 0, 0))
     if not char.grounded:
-        grav -= Vec3(0, 100, 0) * dt
+        grav -= Vec3(0, GRAVITY, 0) * dt
         # Don't use fixed value because dt might change
         # grav -= Vec3(0, 5, 0)
     else:
@@ -35,14 +45,33 @@ def get_displacement(char):
         return displacement
     return apply_physics(char, displacement, ignore=char.ignore_traverse)
 
+def set_collision_world(collision_world):
+    """Collide with a CollisionWorld rather than traversing the scene graph with Ursina's raycast.
+    None goes back to Ursina's raycast."""
+    global _collision_world
+    _collision_world = collision_world
+
+def get_collision_world():
+    """Returns the CollisionWorld set with set_collision_world, or None"""
+    return _collision_world
+
+def cast_ray(origin, direction, distance, ignore=None):
+    """Casts a ray against the collision world if one is set, otherwise the scene
+
+    ignore: entities for Ursina's raycast to ignore, the collision world only holds static
+    geometry so has nothing to ignore"""
+    if _collision_world is not None:
+        return _collision_world.raycast(origin, direction, distance)
+    return raycast(origin, direction=direction, distance=distance, ignore=ignore)
+
 # PRIVATE
 def apply_physics(char, displacement, ignore=[]):
     """Takes a character displacement and returns a collision-modified displacement"""
     disp_norm = distance((0, 0, 0), displacement)
-    ray = raycast(char.world_position, direction=displacement, distance=disp_norm, ignore=ignore)
+    ray = cast_ray(char.world_position, displacement, disp_norm, ignore=ignore)
     if ray.hit:
         normal = ray.world_normal
-        if normal.normalized()[1] <= 0.2:
+        if normal.normalized()[1] <= WALL_NORMAL_Y:
             # Intersection of the plane ax + by + cz = 0 with y = 0
             direction = Vec3(normal[2], 0, -normal[0]).normalized()
             displacement = direction * dot(direction, displacement.normalized()) * disp_norm
@@ -52,7 +81,7 @@ def apply_physics(char, displacement, ignore=[]):
             if not char.grounded:
                 char.grounded = True
                 char_end_jump(char)
-                displacement = ray.world_point - char.world_position + Vec3(0, 1e-3, 0)
+                displacement = ray.world_point - char.world_position + Vec3(0, LANDING_OFFSET, 0)
                 return displacement
             # Intersection of the plane ax + by + cz = 0 with the plane defined by (0, 0, 0),
             # (0, 1, 0), and original displacement
@@ -61,7 +90,7 @@ def apply_physics(char, displacement, ignore=[]):
                              displacement[2] * normal[1]).normalized()
             displacement = direction * disp_norm
     elif char.grounded:
-        down_ray = raycast(char.world_position, direction=char.down, distance=0.2, ignore=ignore)
+        down_ray = cast_ray(char.world_position, char.down, GROUND_RAY_DISTANCE, ignore=ignore)
         if not down_ray.hit:
             char.grounded = False
     # Block upward movement if jumping into a ceiling
@@ -69,8 +98,7 @@ def apply_physics(char, displacement, ignore=[]):
         return displacement
     # Cast ray from top of model, rather than bottom like in handle_collision
     pos = char.position + Vec3(0, char.scale_y, 0)
-    ceiling = raycast(pos, direction=(0, 1, 0), distance=displacement[1],
-                      ignore=ignore)
+    ceiling = cast_ray(pos, (0, 1, 0), displacement[1], ignore=ignore)
     if ceiling.hit:
         displacement[1] = 0
     return displacement
\ No newline at end of file
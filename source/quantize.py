@@ -0,0 +1,166 @@
+"""Compact fixed-point wire types for sending positions and rotations over the network.
+
+Statedefs may use these in place of the type they encode (Vec3 for PackedPosition,
+float for PackedAngle). States still hold ordinary values, the packed type only
+changes how the value is written to and read from a datagram."""
+from ursina import Vec3
+
+from .base import POSITION_QUANTUM, POSITION_BITS, ROTATION_BITS
+
+
+class PackedType:
+    """Base class for wire types. value_type is the type of the value being encoded.
+
+    Subclasses describe their encoding as a struct format of signed integers (b, h, i),
+    to_args converts a value into the integers and from_args converts them back."""
+    value_type = None
+    # Incremented whenever a wire format changes, so precompiled encoders can be rebuilt
+    format_version = 0
+
+    @classmethod
+    def struct_format(cls):
+        raise NotImplementedError
+
+    @classmethod
+    def to_args(cls, value):
+        raise NotImplementedError
+
+    @classmethod
+    def from_args(cls, args):
+        raise NotImplementedError
+
+    @classmethod
+    def serialize(cls, writer, value):
+        write_funcs = {"b": writer.write_int8, "h": writer.write_int16, "i": writer.write_int32}
+        for fmt, arg in zip(cls.struct_format(), cls.to_args(value)):
+            write_funcs[fmt](arg)
+
+    @classmethod
+    def deserialize(cls, reader):
+        read_funcs = {"b": reader.read_int8, "h": reader.read_int16, "i": reader.read_int32}
+        return cls.from_args([read_funcs[fmt]() for fmt in cls.struct_format()])
+
+
+class PackedPosition(PackedType):
+    """Position relative to the zone origin, stored as three signed fixed-point integers.
+
+    Within range, each component is off by at most quantum / 2. Components outside of
+    +/- quantum * 2 ** (bits - 1) are clamped to the edge of the range."""
+    value_type = Vec3
+    quantum = POSITION_QUANTUM
+    bits = POSITION_BITS
+    origin = Vec3(0, 0, 0)
+
+    @classmethod
+    def configure(cls, quantum=None, bits=None, origin=None):
+        """Change the precision/range of positions. Must match between client and server.
+
+        bits: one of 16, 24, 32"""
+        if quantum is not None:
+            cls.quantum = quantum
+        if bits is not None:
+            if bits not in (16, 24, 32):
+                raise ValueError(f"Unsupported number of bits for PackedPosition: {bits}")
+            if bits != cls.bits:
+                PackedType.format_version += 1
+            cls.bits = bits
+        if origin is not None:
+            cls.origin = Vec3(*origin)
+
+    @classmethod
+    def max_error(cls):
+        """Largest error per component for positions within range"""
+        return cls.quantum / 2
+
+    @classmethod
+    def encode(cls, pos):
+        """Converts a position to a tuple of fixed-point integers"""
+        hi = (1 << (cls.bits - 1)) - 1
+        lo = -hi - 1
+        x, y, z = pos
+        ox, oy, oz = cls.origin
+        q = cls.quantum
+        return (min(hi, max(lo, round((x - ox) / q))),
+                min(hi, max(lo, round((y - oy) / q))),
+                min(hi, max(lo, round((z - oz) / q))))
+
+    @classmethod
+    def decode(cls, ints):
+        """Converts a tuple of fixed-point integers back into a position"""
+        x, y, z = ints
+        ox, oy, oz = cls.origin
+        q = cls.quantum
+        return Vec3(x * q + ox, y * q + oy, z * q + oz)
+
+    @classmethod
+    def struct_format(cls):
+        if cls.bits == 16:
+            return "hhh"
+        if cls.bits == 24:
+            # High 16 bits are signed, low 8 bits are shifted into int8 range
+            return "hbhbhb"
+        return "iii"
+
+    @classmethod
+    def to_args(cls, pos):
+        ints = cls.encode(pos)
+        if cls.bits != 24:
+            return ints
+        x, y, z = ints
+        return (x >> 8, (x & 0xFF) - 128, y >> 8, (y & 0xFF) - 128, z >> 8, (z & 0xFF) - 128)
+
+    @classmethod
+    def from_args(cls, args):
+        if cls.bits != 24:
+            return cls.decode(args)
+        xh, xl, yh, yl, zh, zl = args
+        return cls.decode(((xh << 8) + xl + 128, (yh << 8) + yl + 128, (zh << 8) + zl + 128))
+
+
+class PackedAngle(PackedType):
+    """Angle in degrees, stored as a fraction of a full turn in an 8 or 16 bit integer.
+
+    Decoded angles are in [0, 360), and are off by at most 180 / 2 ** bits degrees
+    modulo 360."""
+    value_type = float
+    bits = ROTATION_BITS
+
+    @classmethod
+    def configure(cls, bits=None):
+        """Change the precision of angles. Must match between client and server.
+
+        bits: one of 8, 16"""
+        if bits is not None:
+            if bits not in (8, 16):
+                raise ValueError(f"Unsupported number of bits for PackedAngle: {bits}")
+            if bits != cls.bits:
+                PackedType.format_version += 1
+            cls.bits = bits
+
+    @classmethod
+    def max_error(cls):
+        """Largest error in degrees"""
+        return 180 / (1 << cls.bits)
+
+    @classmethod
+    def encode(cls, angle):
+        """Converts an angle to a signed integer covering one full turn"""
+        steps = 1 << cls.bits
+        return round(angle % 360 / 360 * steps) % steps - steps // 2
+
+    @classmethod
+    def decode(cls, v):
+        steps = 1 << cls.bits
+        return (v + steps // 2) * 360 / steps
+
+    @classmethod
+    def struct_format(cls):
+        return "b" if cls.bits == 8 else "h"
+
+    @classmethod
+    def to_args(cls, angle):
+        return (cls.encode(angle),)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls.decode(args[0])
@@ -2,9 +2,10 @@ from ursina import *
 
 from ..base import *
 from ..network import network
+from ..states import GameEvent
 
 
-dt = 1/5
+dt = POWER_UPDATE_RATE
 
 
 class CombatSystem(Entity):
@@ -18,7 +19,6 @@ class CombatSystem(Entity):
         self.chars = gamestate.uuid_to_char.values()
         self.stat_manager = stat_manager
 
-    @every(dt)
     def tick_combat(self):
         for char in self.chars:
             if not char.target or not char.target.alive:
@@ -26,16 +26,13 @@ class CombatSystem(Entity):
                 char.mh_combat_timer = 0
                 char.oh_combat_timer = 0
             elif char.in_combat:
-                hit_mh = self.attempt_hit(char, "mh")
+                self.attempt_hit(char, "mh")
                 # See if we should progress offhand timer too
                 # (if has skill dw):
                 mh = char.equipment[slot_to_ind["mh"]]
                 mh_is_1h = mh is None or mh.info.get("style", "")[:2] != "2h"
-                hit_oh = False
                 if mh_is_1h:
-                    hit_oh = self.attempt_hit(char, "oh")
-                if hit_mh or hit_mh:
-                    network.broadcast_cbstate_update(char.target)
+                    self.attempt_hit(char, "oh")
 
     def attempt_hit(self, src, slot):
         """Attempts to hit with one weapon"""
@@ -48,30 +45,30 @@ class CombatSystem(Entity):
         attempting = tick_combat_timer(src, slot, wpn, dt)
         if not attempting:
             return False
-        for conn in network.connection_to_uuid:
+        for conn in network.get_observers(src.uuid):
             network.peer.remote_do_attack_anim(conn, src.uuid, slot)
         # Check whether target his within range and in line of sight
-        hittable, msg = get_target_hittable(src, wpn)
+        hittable, reason = get_target_hittable(src, wpn)
         if not hittable:
+            event = GameEvent.make(reason, src, tgt)
             if src_conn is not None:
-                network.peer.remote_print(src_conn, msg)
+                network.queue_event(src_conn, event)
             if tgt_conn is not None and tgt_conn is not src_conn:
-                network.peer.remote_print(tgt_conn, msg)
+                network.queue_event(tgt_conn, event)
             return False
         # Check whether hit goes through
         if random.random() < sigmoid((src.dex - tgt.ref) / 10):
-            msg = f"{src.cname} attempts to hit {tgt.cname}, but misses!"
             if src_conn is not None:
-                network.peer.remote_print(src_conn, msg)
+                network.queue_event(src_conn, GameEvent.make("miss", src, tgt))
             return False
         # If hit goes through, get damage and modify health
         dmg = get_damage(src, tgt, wpn, slot)
         self.stat_manager.reduce_health(tgt, dmg)
-        msg = f"{src.cname} hits {tgt.cname} for {dmg} damage!"
+        event = GameEvent.make("hit", src, tgt, dmg)
         if src_conn is not None:
-            network.peer.remote_print(src_conn, msg)
+            network.queue_event(src_conn, event)
         if tgt_conn is not None and tgt_conn is not src_conn:
-            network.peer.remote_print(tgt_conn, msg)
+            network.queue_event(tgt_conn, event)
         # Potentially raise skill level
         level_up, skill = get_level_up(src, tgt, wpn)
         if level_up:
@@ -98,10 +95,10 @@ def tick_combat_timer(char, slot, wpn, dt):
 def get_target_hittable(src, wpn):
     """Returns a tuple of (hittable, reason) where hittable depends on
     line of sight and whether target is within range, and reason is the
-    reason for returning false (violating either "los" or "range")"""
+    event for returning false (either "cant_see" or "out_of_range")"""
     tgt = src.target
     if not src.get_tgt_los(tgt):
-        return (False, f"You can't see {tgt.cname}.")
+        return (False, "cant_see")
     atk_range = get_wpn_range(wpn)
     # use center rather than center of feet
     pos_src = src.position + Vec3(0, src.scale_y / 2, 0)
@@ -125,7 +122,7 @@ def get_target_hittable(src, wpn):
     if in_range:
         return (True, "")
     else:
-        return (False, f"{tgt.cname} is out of range!")
+        return (False, "out_of_range")
 
 def get_damage(src, tgt, wpn, slot):
     base_dmg = get_wpn_dmg(wpn)
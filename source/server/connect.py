@@ -1,5 +1,8 @@
+import time
+
 from ursina.networking import rpc
 
+from .world import world
 from .. import network
 
 @rpc(network.peer)
@@ -7,11 +10,32 @@ def on_connect(connection, time_received):
     """What server does when a client disconnects. Need to clean up
     character/controller and make clients clean them up as well.
     """
-    pass
+    network.peer.remote_datagram_token(connection, network.datagrams.make_token(connection))
 
 @rpc(network.peer)
 def on_disconnect(connection, time_received):
     """What server does when a client disconnects. Need to clean up
     character/controller, 
     """
-    pass
+    network.connection_to_cbstate_baselines.pop(connection, None)
+    network.connection_to_events.pop(connection, None)
+    network.stats.remove_connection(connection)
+    network.datagrams.remove_connection(connection)
+    network.connection_to_rtt.pop(connection, None)
+    world.send_scheduler.remove_connection(connection)
+    # Forget the connection's player character, so systems that loop over connections skip it
+    uuid = network.connection_to_uuid.pop(connection, None)
+    if uuid is not None:
+        network.uuid_to_connection.pop(uuid, None)
+    world.interest_manager.remove_connection(connection)
+
+@rpc(network.peer)
+def request_clock_ping(connection, time_received, client_time: float, rtt: float, num_snapshots: int):
+    """Replies to a client's clock ping with when it was received and replied to
+
+    rtt: client's current round trip time estimate, 0 if it has none
+    num_snapshots: total snapshot messages the client has received, to measure loss"""
+    if rtt > 0:
+        network.connection_to_rtt[connection] = rtt
+    world.send_scheduler.update_connection_stats(connection, rtt, num_snapshots)
+    network.peer.remote_clock_pong(connection, client_time, time_received, time.time())
@@ -5,7 +5,7 @@ from ..base import *
 from ..network import network
 
 
-dt = 1/5
+dt = POWER_UPDATE_RATE
 
 
 class DeathSystem(Entity):
@@ -16,7 +16,6 @@ class DeathSystem(Entity):
         super().__init__()
         self.chars = gamestate.uuid_to_char.values()
 
-    @every(dt)
     def check_deaths(self):
         """Loop over all characters and check if they need to die
 
@@ -26,7 +25,9 @@ class DeathSystem(Entity):
             if char.health <= 0:
                 char.alive = False
                 uuid = char.uuid
+                observers = list(network.get_observers(uuid))
                 # Lots of complicated stuff handled in char.on_destroy
                 # See World.make_char_on_destroy
                 destroy(char)
-                network.broadcast(network.peer.remote_kill, uuid)
+                for conn in observers:
+                    network.peer.remote_kill(conn, uuid)
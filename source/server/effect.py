@@ -3,7 +3,7 @@ import os
 import json
 import copy
 
-from .. import data_path, Stats
+from .. import data_path, Stats, GameEvent
 
 
 effects_path = os.path.join(data_path, "effects.json")
@@ -67,13 +67,13 @@ class Effect:
         del self.src
         del self.tgt
 
-    def get_msg(self, name, val):
-        msg = ""
+    def get_event(self, name, val):
+        """Returns the GameEvent describing an instant effect, or None if it has no message"""
         if name == "damage":
-            msg = f"{self.tgt.cname} is damaged for {val} damage!"
+            return GameEvent.make("effect_damage", self.src, self.tgt, val)
         if name == "heal":
-            msg = f"{self.src.cname} heals {self.tgt.cname} for {val} health!"
-        return msg
+            return GameEvent.make("effect_heal", self.src, self.tgt, val)
+        return None
 
     def __eq__(self, other):
         return self.src.uuid == other.src.uuid and self.tgt.uuid == other.tgt.uuid \
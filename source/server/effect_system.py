@@ -5,7 +5,7 @@ from ..base import *
 from ..network import network
 
 
-dt = 1/5
+dt = POWER_UPDATE_RATE
 
 
 class EffectSystem(Entity):
@@ -27,39 +27,32 @@ class EffectSystem(Entity):
         self.effect_inst_id_counter += 1
         return Effect(effect_mnem, src, tgt)
 
-    @every(dt)
     def tick_effects(self):
         """Increments effect timers and applies changes to character as needed"""
         for char in self.chars:
-            updated_stats = False
             for effect in char.effects:
-                effect_msgs = []
+                effect_events = []
                 remove = False
                 if effect.timer == 0:
-                    effect_msgs += self.apply_instant_effects(effect, effect_key="start")
+                    effect_events += self.apply_instant_effects(effect, effect_key="start")
                     self.apply_persistent_effects(effect)
-                    updated_stats = True
                 if not char.alive:
                     remove = True
                 if effect.timer >= effect.duration:
                     self.remove_persistent_effects(effect)
-                    effect_msgs += self.apply_instant_effects(effect, effect_key="end")
+                    effect_events += self.apply_instant_effects(effect, effect_key="end")
                     remove = True
-                    updated_stats = True
                 effect.tick_timer += dt
                 if effect.tick_rate and effect.tick_timer >= effect.tick_rate:
                     effect.tick_timer -= effect.tick_rate
-                    effect_msgs += self.apply_instant_effects(effect, effect_key="tick")
-                    updated_stats = True
+                    effect_events += self.apply_instant_effects(effect, effect_key="tick")
                 effect.timer += dt
                 conn = network.uuid_to_connection.get(effect.src.uuid)
                 if conn:
-                    for msg in effect_msgs:
-                        network.peer.remote_print(conn, msg)
+                    for event in effect_events:
+                        network.queue_event(conn, event)
                 if remove: 
                     effect.remove()
-            if updated_stats:
-                network.broadcast_cbstate_update(char)
 
     def apply_persistent_effects(self, effect):
         """Applies stat changes caused by a persistent effect.
@@ -81,15 +74,17 @@ class EffectSystem(Entity):
             "end": effect.end_effects
         }
         effects = key_to_effects.get(effect_key, {})
-        msgs = []
+        events = []
         for name, val in effects.items():
             # Get modified value based on src and tgt stats
             # Consider pulling out into separate function
             if name == "damage":
                 val -= effect.tgt.armor
             self.apply_instant_statchange(effect.tgt, name, val)
-            msgs.append(effect.get_msg(name, val))
-        return msgs
+            event = effect.get_event(name, val)
+            if event is not None:
+                events.append(event)
+        return events
 
     def apply_instant_statchange(self, tgt, name, val):
         """Helper function for applying a single stat change"""
@@ -12,3 +12,4 @@ class GameState:
         self.cooldown_powers = dict()
         self.gcd_chars = dict()
         self.movement_states = dict()
+        self.dirty_chars = dict()
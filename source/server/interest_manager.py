@@ -0,0 +1,153 @@
+import math
+
+from .. import *
+
+
+class InterestManager:
+    """Tracks which characters each connection can see.
+
+    Characters are bucketed into a uniform grid of square cells on the xz plane, so
+    finding the characters near a player character only needs to look at nearby cells.
+    A connection sees every character within radius of its player character, and
+    keeps seeing it until it leaves radius * hysteresis, which stops characters on the
+    boundary from repeatedly spawning and despawning.
+
+    Clients are told to spawn/despawn characters as they enter/leave a connection's
+    view. network.uuid_to_observers is kept up to date so that broadcasts can be
+    limited to the connections that can see a character.
+
+    Spawns are queued per connection and sent in chunks of SPAWN_CHUNK_SIZE. After
+    each chunk that has more to follow, the client requests the next one once it's
+    done constructing the characters, so joining a crowded zone doesn't flood it.
+    """
+    def __init__(self, gamestate, cell_size=INTEREST_CELL_SIZE, radius=INTEREST_RADIUS,
+                 hysteresis=1.1):
+        self.uuid_to_char = gamestate.uuid_to_char
+        self.movement_states = gamestate.movement_states
+        self.cell_size = cell_size
+        self.radius = radius
+        self.hysteresis = hysteresis
+        self.cell_to_uuids = dict()
+        self.uuid_to_cell = dict()
+        self.connection_to_visible = dict()
+        self.uuid_to_observers = network.uuid_to_observers
+        # uuids of characters waiting to be spawned on each connection's client, in order
+        self.connection_to_pending_spawns = dict()
+        # Connections which were sent a spawn chunk and haven't requested the next one yet
+        self.awaiting_spawn_request = set()
+
+    def update(self):
+        """Rebuckets characters that moved and updates what every connection can see"""
+        for uuid, char in self.uuid_to_char.items():
+            self.update_cell(uuid, char)
+        for connection in list(network.connection_to_uuid):
+            self.update_connection(connection)
+
+    def update_cell(self, uuid, char):
+        """Moves a character to the cell containing its position, if needed"""
+        cell = self.get_cell(char.position)
+        old_cell = self.uuid_to_cell.get(uuid)
+        if cell == old_cell:
+            return
+        if old_cell is not None:
+            self.cell_to_uuids[old_cell].discard(uuid)
+            if len(self.cell_to_uuids[old_cell]) == 0:
+                del self.cell_to_uuids[old_cell]
+        self.cell_to_uuids.setdefault(cell, set()).add(uuid)
+        self.uuid_to_cell[uuid] = cell
+
+    def update_connection(self, connection):
+        """Spawns characters that entered the connection's view and despawns ones that left"""
+        pc = self.uuid_to_char.get(network.connection_to_uuid.get(connection))
+        if pc is None:
+            return
+        visible = self.connection_to_visible.setdefault(connection, {pc.uuid})
+        self.uuid_to_observers.setdefault(pc.uuid, set()).add(connection)
+        new_visible = {pc.uuid}
+        enter_sqdist = self.radius ** 2
+        leave_sqdist = (self.radius * self.hysteresis) ** 2
+        for uuid in self.get_nearby_uuids(pc.position, self.radius * self.hysteresis):
+            char = self.uuid_to_char[uuid]
+            max_sqdist = leave_sqdist if uuid in visible else enter_sqdist
+            if sqdist(char.position, pc.position) <= max_sqdist:
+                new_visible.add(uuid)
+        pending = self.connection_to_pending_spawns.setdefault(connection, dict())
+        for uuid in new_visible - visible:
+            pending[uuid] = None
+            self.uuid_to_observers.setdefault(uuid, set()).add(connection)
+        for uuid in visible - new_visible:
+            if uuid in pending:
+                # Client never received it
+                del pending[uuid]
+            else:
+                network.peer.remote_despawn(connection, uuid)
+            network.connection_to_cbstate_baselines.get(connection, {}).pop(uuid, None)
+            self.uuid_to_observers[uuid].discard(connection)
+        self.connection_to_visible[connection] = new_visible
+        if connection not in self.awaiting_spawn_request:
+            self.send_spawn_chunk(connection)
+
+    def send_spawn_chunk(self, connection):
+        """Sends the next chunk of pending spawns to a connection.
+
+        Spawn states are built when sent rather than when queued, so they and the
+        combat state baselines reflect the character at the time the client receives it.
+        Characters that are already running are told to start their run animation, since
+        the client missed when they started."""
+        self.awaiting_spawn_request.discard(connection)
+        pending = self.connection_to_pending_spawns.get(connection)
+        if not pending:
+            return
+        spawn_states = []
+        running = []
+        for uuid in list(pending):
+            if len(spawn_states) >= SPAWN_CHUNK_SIZE:
+                break
+            del pending[uuid]
+            char = self.uuid_to_char.get(uuid)
+            if char is None:
+                continue
+            spawn_states.append(NPCSpawnState(char))
+            network.set_cbstate_baseline(connection, char)
+            movement_state = self.movement_states.get(uuid)
+            if movement_state is not None and movement_state.is_moving:
+                running.append(uuid)
+        network.peer.spawn_npcs(connection, spawn_states, len(pending))
+        for uuid in running:
+            network.peer.remote_start_run_anim(connection, uuid)
+        if len(pending) > 0:
+            self.awaiting_spawn_request.add(connection)
+
+    def get_cell(self, pos):
+        return (math.floor(pos[0] / self.cell_size), math.floor(pos[2] / self.cell_size))
+
+    def get_nearby_uuids(self, pos, radius):
+        """Yields uuids of all characters in cells that overlap the square around pos"""
+        ci, cj = self.get_cell(pos)
+        r = math.ceil(radius / self.cell_size)
+        for i in range(ci - r, ci + r + 1):
+            for j in range(cj - r, cj + r + 1):
+                yield from self.cell_to_uuids.get((i, j), ())
+
+    def get_visible(self, connection):
+        """Returns the uuids of all characters the connection can see"""
+        return self.connection_to_visible.get(connection, ())
+
+    def remove_char(self, uuid):
+        """Forgets a character, for example after it's destroyed.
+        Clients are expected to be told about its removal separately."""
+        cell = self.uuid_to_cell.pop(uuid, None)
+        if cell is not None:
+            self.cell_to_uuids[cell].discard(uuid)
+            if len(self.cell_to_uuids[cell]) == 0:
+                del self.cell_to_uuids[cell]
+        for connection in self.uuid_to_observers.pop(uuid, ()):
+            self.connection_to_visible.get(connection, set()).discard(uuid)
+            self.connection_to_pending_spawns.get(connection, {}).pop(uuid, None)
+
+    def remove_connection(self, connection):
+        """Forgets everything a connection could see"""
+        for uuid in self.connection_to_visible.pop(connection, ()):
+            self.uuid_to_observers.get(uuid, set()).discard(connection)
+        self.connection_to_pending_spawns.pop(connection, None)
+        self.awaiting_spawn_request.discard(connection)
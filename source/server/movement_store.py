@@ -0,0 +1,202 @@
+"""Structure of arrays movement state for every character, stepped all at once with NumPy.
+
+physics.py steps one character at a time from its velocity_components dict. With many
+characters that's dominated by Python overhead, so when NumPy is installed the server keeps
+each character's position, velocities and grounded flag in rows of arrays instead, and
+MovementStore.step runs the same physics as set_gravity_vel, get_displacement and
+apply_physics for every character at once, resolving collisions with batched ray queries.
+
+While a character is in a MovementStore, its row is the authority on its movement, and its
+velocity_components and grounded attrs aren't kept up to date. Its position is written back
+whenever it moves.
+
+Characters that stay grounded without moving for SLEEP_TICKS fall asleep, and aren't stepped
+until they're woken."""
+from ursina import Vec3
+
+from ..base import SLEEP_TICKS
+from ..physics import (dt, GRAVITY, JUMP_SPEED, WALL_NORMAL_Y, GROUND_RAY_DISTANCE, LANDING_OFFSET,
+                       get_collision_world)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAS_NUMPY = np is not None
+INITIAL_CAPACITY = 64
+
+
+class MovementStore:
+    array_names = ("position", "keyboard", "gravity", "jump", "grounded", "height", "awake", "still_ticks")
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.num_chars = 0
+        self.chars = []
+        self.uuid_to_row = dict()
+        self.position = np.zeros((capacity, 3))
+        self.keyboard = np.zeros((capacity, 3))
+        # Gravity and jumping only ever move characters vertically
+        self.gravity = np.zeros(capacity)
+        self.jump = np.zeros(capacity)
+        self.grounded = np.zeros(capacity, dtype=bool)
+        self.height = np.zeros(capacity)
+        self.awake = np.zeros(capacity, dtype=bool)
+        # Ticks each character has been grounded without moving
+        self.still_ticks = np.zeros(capacity, dtype=int)
+
+    def add_char(self, char):
+        if self.num_chars == len(self.position):
+            self.grow()
+        row = self.num_chars
+        self.num_chars += 1
+        self.chars.append(char)
+        self.uuid_to_row[char.uuid] = row
+        self.position[row] = tuple(char.position)
+        self.keyboard[row] = tuple(char.velocity_components.get("keyboard", (0, 0, 0)))
+        self.gravity[row] = char.velocity_components.get("gravity", (0, 0, 0))[1]
+        self.jump[row] = char.velocity_components.get("jump", (0, 0, 0))[1]
+        self.grounded[row] = char.grounded
+        self.height[row] = char.scale_y
+        self.awake[row] = True
+        self.still_ticks[row] = 0
+
+    def remove_char(self, uuid):
+        """Removes a character, moving the last row into its place"""
+        row = self.uuid_to_row.pop(uuid, None)
+        if row is None:
+            return
+        last = self.num_chars - 1
+        if row != last:
+            moved = self.chars[last]
+            self.chars[row] = moved
+            self.uuid_to_row[moved.uuid] = row
+            for array in self.get_arrays():
+                array[row] = array[last]
+        self.chars.pop()
+        self.num_chars -= 1
+
+    def grow(self):
+        capacity = 2 * len(self.position)
+        for name in self.array_names:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def get_arrays(self):
+        return [getattr(self, name) for name in self.array_names]
+
+    def set_keyboard_velocity(self, char, velocity):
+        row = self.uuid_to_row[char.uuid]
+        self.keyboard[row] = tuple(velocity)
+        if any(velocity):
+            self.wake_row(row)
+
+    def start_jump(self, char):
+        """Same as physics.char_start_jump"""
+        row = self.uuid_to_row[char.uuid]
+        if self.grounded[row]:
+            self.grounded[row] = False
+            self.jump[row] = JUMP_SPEED
+            self.wake_row(row)
+
+    def wake(self, char):
+        self.wake_row(self.uuid_to_row[char.uuid])
+
+    def wake_row(self, row):
+        self.awake[row] = True
+        self.still_ticks[row] = 0
+
+    def wake_region(self, lower, upper):
+        """Wakes every character with a position within the box from lower to upper"""
+        n = self.num_chars
+        inside = ((self.position[:n] >= lower) & (self.position[:n] <= upper)).all(axis=1)
+        self.awake[:n] |= inside
+        self.still_ticks[:n][inside] = 0
+
+    def is_asleep(self, char):
+        return not self.awake[self.uuid_to_row[char.uuid]]
+
+    def step(self):
+        """Moves every awake character by one tick of physics
+
+        Keyboard velocities only last one tick, like in MovementSystem.tick_char_physics."""
+        rows = np.flatnonzero(self.awake[:self.num_chars])
+        if len(rows) == 0:
+            return
+        grounded = self.grounded[rows]
+        gravity = np.where(grounded, 0, self.gravity[rows] - GRAVITY * dt)
+        self.gravity[rows] = gravity
+        displacement = self.keyboard[rows] * dt
+        displacement[:, 1] += (gravity + self.jump[rows]) * dt
+        is_moving = displacement.any(axis=1)
+        moving = rows[is_moving]
+        if len(moving):
+            displacement = self.collide(moving, displacement[is_moving])
+            self.position[moving] += displacement
+            for row, position in zip(moving.tolist(), self.position[moving].tolist()):
+                self.chars[row].position = Vec3(*position)
+        self.keyboard[rows] = 0
+        still = self.grounded[rows] & ~is_moving
+        still_ticks = np.where(still, self.still_ticks[rows] + 1, 0)
+        self.still_ticks[rows] = still_ticks
+        self.awake[rows] = still_ticks < SLEEP_TICKS
+
+    def collide(self, rows, displacement):
+        """Returns the displacements of characters in rows modified by collisions, and updates
+        their grounded and jump state, in the same way as physics.apply_physics"""
+        collision_world = get_collision_world()
+        if collision_world is None:
+            # Nothing to collide with, but grounded characters still fall
+            self.grounded[rows] = False
+            return displacement
+        position = self.position[rows]
+        grounded = self.grounded[rows]
+        length = np.linalg.norm(displacement, axis=1)
+        hit, _, point, normal = collision_world.raycast_batch(position, displacement, length)
+        wall = hit & (normal[:, 1] <= WALL_NORMAL_Y)
+        floor = hit & ~wall
+        landed = floor & ~grounded
+        slope = floor & grounded
+        new_displacement = displacement.copy()
+        if wall.any():
+            # Intersection of the wall's plane with y = 0
+            direction = normalize(np.stack([normal[wall, 2], np.zeros(wall.sum()), -normal[wall, 0]], axis=1))
+            along = (direction * displacement[wall]).sum(axis=1) / length[wall]
+            new_displacement[wall] = direction * (along * length[wall])[:, None]
+        if slope.any():
+            # Intersection of the slope's plane with the vertical plane of the displacement
+            d = displacement[slope]
+            nx, ny, nz = normal[slope].T
+            direction = normalize(np.stack([d[:, 0] * ny, -d[:, 2] * nz - d[:, 0] * nx, d[:, 2] * ny], axis=1))
+            new_displacement[slope] = direction * length[slope, None]
+        if landed.any():
+            new_displacement[landed] = point[landed] - position[landed]
+            new_displacement[landed, 1] += LANDING_OFFSET
+        self.grounded[rows[hit]] = True
+        self.jump[rows[hit]] = 0
+        falling = ~hit & grounded
+        if falling.any():
+            down = np.zeros((falling.sum(), 3))
+            down[:, 1] = -1
+            ground, _, _, _ = collision_world.raycast_batch(position[falling], down,
+                                                            np.full(len(down), GROUND_RAY_DISTANCE))
+            self.grounded[rows[falling][~ground]] = False
+        # Block upward movement into ceilings, from the top of the character
+        rising = ~landed & (new_displacement[:, 1] >= 0)
+        if rising.any():
+            top = position[rising].copy()
+            top[:, 1] += self.height[rows[rising]]
+            up = np.zeros((rising.sum(), 3))
+            up[:, 1] = 1
+            ceiling, _, _, _ = collision_world.raycast_batch(top, up, new_displacement[rising, 1])
+            blocked = np.flatnonzero(rising)[ceiling]
+            new_displacement[blocked, 1] = 0
+        return new_displacement
+
+
+def normalize(vectors):
+    """Normalizes rows of vectors, leaving zero rows as zero like Vec3.normalized"""
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
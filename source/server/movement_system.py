@@ -1,80 +1,354 @@
 from ursina import *
 
+from .movement_store import MovementStore, HAS_NUMPY
 from .. import *
 
 
 class MovementSystem(Entity):
-    def __init__(self, gamestate):
+    def __init__(self, gamestate, interest_manager, send_scheduler):
         super().__init__()
+        self.uuid_to_char = gamestate.uuid_to_char
         self.chars = gamestate.uuid_to_char.values()
+        # Steps every character's physics at once if NumPy is installed, otherwise characters
+        # are stepped one by one with physics.py
+        self.store = MovementStore() if HAS_NUMPY else None
+        # Uuids of characters that have been sent movement inputs
+        self.input_uuids = set()
+        self.interest_manager = interest_manager
+        self.send_scheduler = send_scheduler
         self.movement_states = gamestate.movement_states
-        self.sequence_number = 0
+        # Sent with snapshots so clients can drop ones that arrive late
+        self.tick = 0
+        # Maps connection to uuid to (position, rotation_y, tick) last sent for that character
+        self.connection_to_sent = dict()
+        # Maps connection to uuid to (position, rotation_y, snapshot id) of the newest state of
+        # that character the client acknowledged
+        self.connection_to_acked = dict()
+        # Maps connection to snapshot id to [(uuid, position, rotation_y)] of the characters in
+        # snapshot datagrams that haven't been acknowledged yet, oldest first
+        self.connection_to_unacked = dict()
+        # Maps connection to uuids of characters left out for being unchanged since they were
+        # last sent there. Clients hold these still until the tick before they're sent again.
+        self.connection_to_held = dict()
+        self.sent_sequence_numbers = dict()
+        self.num_suppressed = 0
 
     def add_char(self, char):
         """Add a MovementState
 
         Does not touch uuid_to_char"""
         self.movement_states[char.uuid] = MovementState()
+        if self.store is not None:
+            self.store.add_char(char)
+
+    def remove_char(self, uuid):
+        if self.store is not None:
+            self.store.remove_char(uuid)
+        self.input_uuids.discard(uuid)
 
-    @every(PHYSICS_UPDATE_RATE)
     def tick_physics(self):
-        for char in self.chars:
-            self.tick_char_physics(char)
+        for uuid in self.input_uuids:
+            movement_input = self.next_input(self.movement_states[uuid])
+            if movement_input is not None:
+                self.handle_movement_inputs(self.uuid_to_char[uuid], *movement_input)
+        if self.store is not None:
+            self.store.step()
+        else:
+            for char in self.chars:
+                movement_state = self.movement_states[char.uuid]
+                if movement_state.asleep:
+                    continue
+                displacement = self.tick_char_physics(char)
+                self.update_sleep(movement_state, char.grounded and displacement == Vec3(0, 0, 0))
+        self.interest_manager.update()
+        # This executes client-side movement/rotation correction, to test movement without this
+        # overhead, comment this line.
+        self.send_snapshots()
 
     def tick_char_physics(self, char):
-        movement_state = self.movement_states[char.uuid]
         # Assumed that keyboard component gets set by a client
         set_gravity_vel(char)
         displacement = get_displacement(char)
         char.position += displacement
         char.velocity_components["keyboard"] = Vec3(0, 0, 0)
-        # This executes client-side movement/rotation correct, to test movement without this
-        # overhead, comment the rest of this function.
+        return displacement
+
+    def update_sleep(self, movement_state, still):
+        """Puts a character to sleep once it's been still for SLEEP_TICKS
+
+        still: whether it stayed grounded without moving this tick"""
+        movement_state.still_ticks = movement_state.still_ticks + 1 if still else 0
+        movement_state.asleep = movement_state.still_ticks >= SLEEP_TICKS
+
+    def set_keyboard_velocity(self, char, velocity):
+        """Sets the velocity a character moves at on the next tick"""
+        if self.store is not None:
+            self.store.set_keyboard_velocity(char, velocity)
+            return
+        char.velocity_components["keyboard"] = velocity
+        if velocity != Vec3(0, 0, 0):
+            self.wake(char)
+
+    def start_jump(self, char):
+        if self.store is not None:
+            self.store.start_jump(char)
+            return
+        if char.grounded:
+            char_start_jump(char)
+            self.wake(char)
+
+    def wake(self, char):
+        """Resumes stepping a sleeping character's physics. Anything that moves a character other
+        than through MovementSystem, like a knockback, must wake it."""
+        if self.store is not None:
+            self.store.wake(char)
+            return
+        movement_state = self.movement_states[char.uuid]
+        movement_state.asleep = False
+        movement_state.still_ticks = 0
+
+    def wake_region(self, lower, upper):
+        """Wakes every character within the box from lower to upper, for example after the
+        geometry there changes"""
+        if self.store is not None:
+            self.store.wake_region(lower, upper)
+            return
+        for char in self.chars:
+            if all(lo <= x <= hi for lo, x, hi in zip(lower, char.position, upper)):
+                self.wake(char)
+
+    def is_asleep(self, char):
+        if self.store is not None:
+            return self.store.is_asleep(char)
+        return self.movement_states[char.uuid].asleep
+
+    def send_snapshots(self):
+        """Sends a single snapshot of the position/rotation of every visible character to each
+        connection
+
+        Each character's state is built once per tick and shared by all connections that can see it.
+        Characters which haven't moved noticeably since the last state of them the client
+        acknowledged are left out, except for a keepalive every SNAPSHOT_KEEPALIVE_TICKS, so idle
+        characters cost next to nothing. Since snapshots can be lost, a character that stopped
+        keeps being sent until the client acknowledges a snapshot with its resting state. The
+        SendScheduler then picks which of the rest fit in the connection's bandwidth budget,
+        and characters that don't fit stay pending for later ticks.
+        Snapshots go over the unreliable datagram channel, split to fit in datagrams. Each
+        datagram has a bitmask of its entries for characters that were left out for being
+        unchanged, rather than waiting for the budget, since they were last sent."""
+        self.tick += 1
+        server_time = time.time()
+        uuid_to_state = {char.uuid: SnapshotState(char) for char in self.chars}
+        entry_size = 0
+        if uuid_to_state:
+            # SnapshotState is fixed-width, so this is the size of every entry
+            entry_size = SnapshotState.get_codec().fixed_size
+        for conn in list(self.connection_to_sent):
+            if conn not in network.connection_to_uuid:
+                del self.connection_to_sent[conn]
+                self.connection_to_acked.pop(conn, None)
+                self.connection_to_unacked.pop(conn, None)
+                self.connection_to_held.pop(conn, None)
+                self.sent_sequence_numbers.pop(conn, None)
         for conn, uuid in network.connection_to_uuid.items():
-            if char.uuid == uuid:
-                network.peer.update_pc_lerp_attrs(
-                    conn,
-                    movement_state.sequence_number,
-                    char.position,
-                    char.rotation_y
-                )
-            else:
-                network.peer.update_npc_lerp_attrs(
-                    conn,
-                    char.uuid,
-                    char.position,
-                    char.rotation_y
-                )
-
-    def handle_movement_inputs(self, char, sequence_number, kb_direction, kb_y_rotation, mouse_y_rotation):
-        """Processes movement inputs from a client"""
+            movement_state = self.movement_states[uuid]
+            sent = self.connection_to_sent.get(conn, {})
+            acked = self.connection_to_acked.get(conn, {})
+            held = self.connection_to_held.get(conn, set())
+            # Only keep records of visible characters, so ones that come back into view are sent
+            new_sent = dict()
+            new_acked = dict()
+            new_held = set()
+            candidates = []
+            for vis_uuid in self.interest_manager.get_visible(conn):
+                state = uuid_to_state.get(vis_uuid)
+                if state is None:
+                    continue
+                record = sent.get(vis_uuid)
+                new_sent[vis_uuid] = record
+                if vis_uuid in acked:
+                    new_acked[vis_uuid] = acked[vis_uuid]
+                # The player's own character also acknowledges each input the client sent
+                ack = vis_uuid == uuid and self.sent_sequence_numbers.get(conn) != movement_state.last_applied
+                if record is None or ack or self.needs_send(state, record, acked.get(vis_uuid)):
+                    candidates.append((vis_uuid, state))
+                else:
+                    self.num_suppressed += 1
+                    new_held.add(vis_uuid)
+                if vis_uuid in held:
+                    new_held.add(vis_uuid)
+            snapshot = []
+            was_held = []
+            for vis_uuid, state in self.send_scheduler.select(conn, uuid, candidates, entry_size):
+                new_sent[vis_uuid] = (state["position"], state["rotation_y"], self.tick)
+                snapshot.append(state)
+                was_held.append(vis_uuid in new_held)
+                new_held.discard(vis_uuid)
+            # Characters never sent have no record yet, and stay pending until they're selected
+            self.connection_to_sent[conn] = {k: v for k, v in new_sent.items() if v is not None}
+            self.connection_to_acked[conn] = new_acked
+            self.connection_to_held[conn] = new_held
+            unacked = self.connection_to_unacked.setdefault(conn, dict())
+            # Acknowledgements older than the keepalive don't matter, it has been resent since
+            for snapshot_id in list(unacked):
+                if (snapshot_id >> SNAPSHOT_CHUNK_BITS) > self.tick - SNAPSHOT_KEEPALIVE_TICKS:
+                    break
+                del unacked[snapshot_id]
+            self.sent_sequence_numbers[conn] = movement_state.last_applied
+            num_messages = 0
+            for i in range(0, len(snapshot), MAX_SNAPSHOTS_PER_DATAGRAM):
+                chunk = snapshot[i:i + MAX_SNAPSHOTS_PER_DATAGRAM]
+                chunk_held = was_held[i:i + MAX_SNAPSHOTS_PER_DATAGRAM]
+                held_mask = sum(1 << j for j, is_held in enumerate(chunk_held) if is_held)
+                snapshot_id = (self.tick << SNAPSHOT_CHUNK_BITS) + num_messages
+                unacked[snapshot_id] = [(state["uuid"], state["position"], state["rotation_y"])
+                                        for state in chunk]
+                network.send_unreliable(conn, self.tick, "update_snapshot", server_time, snapshot_id,
+                                        movement_state.sequence_number, chunk, held_mask)
+                num_messages += 1
+            self.send_scheduler.record_sent(conn, num_messages)
+
+    def needs_send(self, state, record, acked):
+        """Whether a character's SnapshotState differs enough from the newest state of it a
+        connection acknowledged, or was last sent long enough ago, to send it again
+
+        record: (position, rotation_y, tick) last sent
+        acked: (position, rotation_y, snapshot id) last acknowledged, or None"""
+        _, _, tick = record
+        if self.tick - tick >= SNAPSHOT_KEEPALIVE_TICKS:
+            return True
+        return acked is None or self.has_moved(state, acked)
+
+    def ack_snapshots(self, connection, snapshot_ids):
+        """Records the snapshot datagrams a client handled, so characters whose state it
+        acknowledged are no longer sent while they stay still"""
+        unacked = self.connection_to_unacked.get(connection)
+        if unacked is None:
+            return
+        sent = self.connection_to_sent[connection]
+        acked = self.connection_to_acked[connection]
+        for snapshot_id in snapshot_ids:
+            entries = unacked.pop(snapshot_id, None)
+            if entries is None:
+                # Already acknowledged, or too old to matter
+                continue
+            for uuid, pos, rot in entries:
+                if uuid not in sent:
+                    # Out of view since, it's sent in full when it comes back
+                    continue
+                prev = acked.get(uuid)
+                if prev is None or prev[2] < snapshot_id:
+                    acked[uuid] = (pos, rot, snapshot_id)
+
+    def has_moved(self, state, record):
+        """Whether a character's SnapshotState moved/turned past the thresholds since record"""
+        pos, rot = record[0], record[1]
+        if sqdist(state["position"], pos) > SNAPSHOT_POSITION_THRESHOLD ** 2:
+            return True
+        rot_diff = (state["rotation_y"] - rot + 180) % 360 - 180
+        return abs(rot_diff) > SNAPSHOT_ROTATION_THRESHOLD
+
+    def queue_input(self, char, sequence_number, kb_direction, kb_y_rotation, mouse_y_rotation, jumped):
+        """Queues movement inputs from a client, to be applied one per tick by tick_physics
+
+        Clients only send inputs when they change, so the ticks between two inputs repeat the
+        earlier one. An input for a tick that was already simulated by repeating is applied on
+        the next tick instead, merged with any other late input already there. If the client
+        gets more than MAX_QUEUED_INPUTS ticks ahead, for example after a burst of late packets,
+        the oldest ticks are skipped, keeping any mouse rotation and jump so they aren't lost."""
         movement_state = self.movement_states[char.uuid]
+        if sequence_number <= movement_state.last_received:
+            return
+        movement_state.last_received = sequence_number
+        self.input_uuids.add(char.uuid)
+        inputs = movement_state.inputs
+        movement_input = (kb_direction, kb_y_rotation, mouse_y_rotation, jumped)
+        if sequence_number <= movement_state.sequence_number:
+            sequence_number = movement_state.sequence_number + 1
+            if sequence_number in inputs:
+                movement_input = merge_inputs(inputs[sequence_number], movement_input)
+        inputs[sequence_number] = movement_input
+        while sequence_number - movement_state.sequence_number > MAX_QUEUED_INPUTS:
+            oldest = min(inputs)
+            if oldest > movement_state.sequence_number + 1:
+                # Skip repeated ticks up to the oldest input
+                movement_state.num_dropped += oldest - 1 - movement_state.sequence_number
+                movement_state.sequence_number = oldest - 1
+                continue
+            movement_state.last_input = inputs.pop(oldest)
+            movement_state.sequence_number = oldest
+            movement_state.num_dropped += 1
+            next_num = min(inputs)
+            inputs[next_num] = merge_inputs(movement_state.last_input, inputs[next_num])
+
+    def next_input(self, movement_state):
+        """Returns the input to apply this tick as (kb_direction, kb_y_rotation, mouse_y_rotation,
+        jumped), or None if the character has never had an input
+
+        Each tick advances the sequence number by one. If there's no input for it, the last
+        input is repeated without its mouse rotation or jump."""
+        if movement_state.last_input is None and not movement_state.inputs:
+            return None
+        movement_state.sequence_number += 1
+        inputs = movement_state.inputs
+        if movement_state.last_input is None and movement_state.sequence_number not in inputs:
+            # Nothing to repeat yet, start from the first input received
+            movement_state.sequence_number = min(inputs)
+        movement_input = inputs.pop(movement_state.sequence_number, None)
+        if movement_input is not None:
+            movement_state.last_input = movement_input
+            movement_state.last_applied = movement_state.sequence_number
+            return movement_input
+        movement_state.num_repeated += 1
+        kb_direction, kb_y_rotation, _, _ = movement_state.last_input
+        return (kb_direction, kb_y_rotation, 0, False)
+
+    def handle_movement_inputs(self, char, kb_direction, kb_y_rotation, mouse_y_rotation, jumped):
+        """Applies one tick of movement inputs from a client"""
+        movement_state = self.movement_states[char.uuid]
+        if jumped:
+            self.start_jump(char)
         char_speed = get_speed_modifier(char.speed)
         vel = (char.right * kb_direction[0] + char.forward * kb_direction[1]).normalized() * 10 * char_speed
-        if "keyboard" not in char.velocity_components:
-            char.velocity_components["keyboard"] = vel
-        char.velocity_components["keyboard"] += vel
+        self.set_keyboard_velocity(char, vel)
         # char_rotation = Vec3(0, kb_y_rotation[1] * 100 * math.cos(math.radians(self.focus.rotation_x)), 0)
         y_rotation = kb_y_rotation * 100 * PHYSICS_UPDATE_RATE + mouse_y_rotation
         char.rotation_y += y_rotation
-        # Will send back the most recently received sequence number to match the predicted state.
-        # If packets arrive out of order, we want to update based on last sequence number
-        if sequence_number > movement_state.sequence_number:
-            movement_state.sequence_number = sequence_number
         # Update client's NPC animation
         if kb_direction != Vec2(0, 0) and movement_state.is_moving == False:
             movement_state.is_moving = True
-            for conn, uuid in network.connection_to_uuid.items():
-                if char.uuid != uuid:
+            for conn in network.get_observers(char.uuid):
+                if char.uuid != network.connection_to_uuid.get(conn):
                     network.peer.remote_start_run_anim(conn, char.uuid)
         elif kb_direction == Vec2(0, 0) and movement_state.is_moving == True:
             movement_state.is_moving = False
-            for conn, uuid in network.connection_to_uuid.items():
-                if char.uuid != uuid:
+            for conn in network.get_observers(char.uuid):
+                if char.uuid != network.connection_to_uuid.get(conn):
                     network.peer.remote_end_run_anim(conn, char.uuid)
 
 
 class MovementState:
     def __init__(self):
         self.is_moving = False
-        self.sequence_number = 0
+        # Sequence number of the last tick of input applied, sent back to the client to reconcile
+        # with. Advances every tick, including ticks where the last input is repeated.
+        self.sequence_number = -1
+        # Sequence numbers of the last input received from the client, and the last one applied
+        self.last_received = -1
+        self.last_applied = -1
+        # Maps sequence number to queued (kb_direction, kb_y_rotation, mouse_y_rotation, jumped)
+        self.inputs = dict()
+        self.last_input = None
+        # Sleeping characters skip physics until woken, see MovementSystem.update_sleep. Unused
+        # when MovementSystem has a MovementStore, which tracks this itself.
+        self.asleep = False
+        self.still_ticks = 0
+        self.num_dropped = 0
+        self.num_repeated = 0
+
+
+def merge_inputs(earlier, later):
+    """Combines two inputs into one tick, keeping the later keyboard state and both of their
+    mouse rotations and jumps"""
+    kb_direction, kb_y_rotation, mouse_y_rotation, jumped = later
+    return (kb_direction, kb_y_rotation, earlier[2] + mouse_y_rotation, earlier[3] or jumped)
@@ -2,7 +2,6 @@ from ursina import *
 
 from .effect import *
 from ..base import *
-from ..network import network
 from ..power import Power
 
 
@@ -15,8 +14,9 @@ class PowerSystem(Entity):
     This class does not have ownership over powers. Instead, powers are created
     by World, this class is merely for managing the per-tick Power operations,
     and are accessed through Characters."""
-    def __init__(self, gamestate, effect_system):
+    def __init__(self, gamestate, effect_system, stat_manager):
         self.effect_system = effect_system
+        self.stat_manager = stat_manager
         super().__init__()
         self.power_inst_id_ct = 0
         self.inst_id_to_power = gamestate.inst_id_to_power
@@ -30,7 +30,6 @@ class PowerSystem(Entity):
         self.inst_id_to_power[inst_id] = power
         return power
 
-    @every(dt)
     def tick_cooldowns(self):
         """Increment all cooldowns by dt.
 
@@ -54,12 +53,10 @@ class PowerSystem(Entity):
             return
         if src.energy < power.cost:
             return
-        src.energy -= power.cost
+        self.stat_manager.reduce_energy(src, power.cost)
         src.start_gcd(power.gcd_duration)
         self.gcd_chars[src.uuid] = src
         power.start_cooldown()
         self.cooldown_powers[power.inst_id] = power
         effect = self.effect_system.make_effect(power.effect_mnem, src, tgt)
         effect.attempt_apply()
-        # Upon using a power, need to update stats (mainly energy) to clients
-        network.broadcast_cbstate_update(tgt)
@@ -0,0 +1,35 @@
+from ursina import *
+
+from .. import *
+
+
+class ReplicationSystem(Entity):
+    """Sends the combat state of every character whose stats changed, once per tick.
+
+    Systems never send combat states directly, instead StatManager marks characters
+    dirty whenever their stats change. A character hit several times in one tick is
+    then only serialized and sent once."""
+    def __init__(self, gamestate, stat_manager):
+        super().__init__()
+        self.uuid_to_char = gamestate.uuid_to_char
+        self.dirty_chars = gamestate.dirty_chars
+        self.stat_manager = stat_manager
+        # Counts from the most recent replication pass
+        self.last_tick_counts = {"marked": 0, "sent": 0, "avoided": 0}
+        # Counts summed over all replication passes
+        self.total_counts = {"marked": 0, "sent": 0, "avoided": 0}
+
+    def tick_replication(self):
+        sent = 0
+        for uuid, char in self.dirty_chars.items():
+            # Character may have been destroyed since being marked
+            if self.uuid_to_char.get(uuid) is not char:
+                continue
+            network.broadcast_cbstate_update(char)
+            sent += 1
+        marked = self.stat_manager.num_marked
+        self.last_tick_counts = {"marked": marked, "sent": sent, "avoided": marked - sent}
+        for k, v in self.last_tick_counts.items():
+            self.total_counts[k] += v
+        self.dirty_chars.clear()
+        self.stat_manager.num_marked = 0
@@ -0,0 +1,137 @@
+import collections
+import time
+
+from .. import *
+
+
+class SendScheduler:
+    """Decides which characters go in each connection's snapshot, within a per-connection
+    bandwidth budget.
+
+    Each connection has a budget in bytes per second, spent from a token bucket. Characters
+    that need sending gain priority every tick they wait, faster for the player's target and
+    for nearby characters, and the highest priority ones are sent until the tick's tokens run
+    out. The rest wait for a later tick, so constrained clients get each character less often
+    rather than the server queueing data for them.
+
+    The budget adapts to each client like TCP congestion control: clients report how many
+    snapshots they received along with their round trip time, and the budget shrinks when
+    snapshots go missing or the round trip time inflates, and slowly grows otherwise."""
+    def __init__(self, gamestate):
+        self.uuid_to_char = gamestate.uuid_to_char
+        self.connection_to_rate = dict()
+
+    def get_rate(self, connection):
+        rate = self.connection_to_rate.get(connection)
+        if rate is None:
+            rate = self.connection_to_rate[connection] = ConnectionRate()
+        return rate
+
+    def select(self, connection, pc_uuid, candidates, entry_size):
+        """Returns the (uuid, state) pairs from candidates to send to connection this tick
+
+        pc_uuid: uuid of the connection's player character, always sent if it's a candidate
+        candidates: list of (uuid, state) pairs which need sending
+        entry_size: estimated bytes per state"""
+        rate = self.get_rate(connection)
+        rate.refill()
+        pc = self.uuid_to_char.get(pc_uuid)
+        # Characters that stopped needing to be sent lose their priority
+        priorities = {uuid: rate.priorities.get(uuid, 0) + self.get_weight(pc, uuid)
+                      for uuid, _ in candidates}
+        rate.priorities = priorities
+        candidates = sorted(candidates, key=lambda item: priorities[item[0]], reverse=True)
+        selected = []
+        for uuid, state in candidates:
+            if uuid != pc_uuid and rate.tokens < entry_size:
+                rate.limited = True
+                break
+            rate.tokens -= entry_size
+            del priorities[uuid]
+            selected.append((uuid, state))
+        return selected
+
+    def get_weight(self, pc, uuid):
+        """Returns how much priority a character gains per tick for a player character"""
+        if pc is None or pc.uuid == uuid:
+            return float("inf")
+        if pc.target is not None and pc.target.uuid == uuid:
+            return SEND_TARGET_WEIGHT
+        char = self.uuid_to_char[uuid]
+        return 1 / (1 + sqdist(char.position, pc.position) / SEND_DISTANCE_FALLOFF ** 2)
+
+    def record_sent(self, connection, num_messages):
+        """Records how many snapshot messages were sent to connection this tick"""
+        self.get_rate(connection).record_sent(num_messages)
+
+    def update_connection_stats(self, connection, rtt, num_received):
+        """Adapts a connection's budget to a report from its client
+
+        rtt: client's smoothed round trip time, 0 if unknown
+        num_received: total snapshot messages the client has received"""
+        self.get_rate(connection).update(rtt, num_received)
+
+    def forget(self, uuid):
+        """Forgets a character, for example after it's destroyed"""
+        for rate in self.connection_to_rate.values():
+            rate.priorities.pop(uuid, None)
+
+    def remove_connection(self, connection):
+        self.connection_to_rate.pop(connection, None)
+
+
+class ConnectionRate:
+    """Bandwidth budget and measurements for a single connection"""
+    def __init__(self):
+        self.budget = SEND_BUDGET_DEFAULT
+        self.tokens = self.budget * PHYSICS_UPDATE_RATE
+        self.last_refill = time.time()
+        # Whether any snapshots had to wait for the budget since the last report
+        self.limited = False
+        # Maps uuid to priority of characters waiting to be sent
+        self.priorities = dict()
+        # Times and running totals of snapshot messages sent, to compare against reports
+        self.num_sent = 0
+        self.sent_history = collections.deque(maxlen=200)
+        self.min_rtt = None
+        self.last_report_sent = None
+        self.last_report_received = 0
+        self.num_decreases = 0
+
+    def refill(self):
+        now = time.time()
+        self.tokens += self.budget * (now - self.last_refill)
+        self.tokens = min(self.tokens, self.budget * SEND_MAX_BURST)
+        self.last_refill = now
+
+    def record_sent(self, num_messages):
+        self.num_sent += num_messages
+        self.sent_history.append((time.time(), self.num_sent))
+
+    def get_num_sent_before(self, t):
+        """Returns the total snapshot messages sent before time t"""
+        num_sent = 0
+        for sent_time, total in self.sent_history:
+            if sent_time > t:
+                break
+            num_sent = total
+        return num_sent
+
+    def update(self, rtt, num_received):
+        if rtt <= 0:
+            return
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        # Only messages sent a round trip ago could have been received by the time of the report
+        num_sent = self.get_num_sent_before(time.time() - rtt)
+        if self.last_report_sent is not None:
+            sent = num_sent - self.last_report_sent
+            received = num_received - self.last_report_received
+            loss = 1 - received / sent if sent > 0 else 0
+            if loss > SEND_LOSS_THRESHOLD or rtt > 2 * self.min_rtt + SEND_RTT_SLACK:
+                self.budget = max(SEND_BUDGET_MIN, self.budget * SEND_BUDGET_DECREASE)
+                self.num_decreases += 1
+            elif self.limited:
+                self.budget = min(SEND_BUDGET_MAX, self.budget + SEND_BUDGET_INCREASE)
+        self.last_report_sent = num_sent
+        self.last_report_received = num_received
+        self.limited = False
@@ -1,6 +1,18 @@
 class StatManager:
+    """Provides an interface for all changes to character stats.
+
+    Characters whose stats change are marked dirty, and their combat states are sent
+    to clients once per tick by ReplicationSystem."""
     def __init__(self, gamestate):
         self.gamestate = gamestate
+        self.dirty_chars = gamestate.dirty_chars
+        # Number of times a character was marked dirty since the last replication pass
+        self.num_marked = 0
+
+    def mark_dirty(self, char):
+        """Flag char's combat state as needing to be sent to clients"""
+        self.dirty_chars[char.uuid] = char
+        self.num_marked += 1
 
     def update_max_ratings(self, char):
         """Adjust max ratings, for example after receiving a stat update."""
@@ -8,16 +20,24 @@ class StatManager:
         char.maxenergy = char.staticenergy
         char.health = min(char.maxhealth, char.health)
         char.energy = min(char.maxenergy, char.energy)
+        self.mark_dirty(char)
 
     def increase_health(self, char, amt):
         """Function to be used whenever increasing character's health"""
         char.health = min(char.maxhealth, char.health + amt)
+        self.mark_dirty(char)
 
     def reduce_health(self, char, amt):
         """Function to be used whenever decreasing character's health
 
         Todo: If health <= 0, kill the character"""
         char.health -= amt
+        self.mark_dirty(char)
+
+    def reduce_energy(self, char, amt):
+        """Function to be used whenever decreasing character's energy"""
+        char.energy -= amt
+        self.mark_dirty(char)
 
     def apply_state_diff(self, char, state, remove=False):
         """Apply attrs to a destination object by adding/subtracting the attrs
@@ -0,0 +1,85 @@
+import time
+
+from ursina import Entity
+
+from .. import *
+
+
+class ServerTicker(Entity):
+    """Runs the server's systems at a fixed timestep, in a fixed order.
+
+    Time from Ursina's frames is added to an accumulator, and a tick runs for every tick_rate
+    seconds in it. Each tick calls the registered functions in the order they were added, some
+    only every few ticks, so simulation happens at the same rate however frames are timed.
+    After a stall, up to max_catch_up ticks run in one frame to catch up, and any further ticks
+    are skipped rather than letting the server fall further behind. Ticks that take longer than
+    tick_rate are reported."""
+    def __init__(self, tick_rate=PHYSICS_UPDATE_RATE, max_catch_up=MAX_CATCH_UP_TICKS):
+        super().__init__()
+        self.tick_rate = tick_rate
+        self.max_catch_up = max_catch_up
+        # (function, ticks between calls) in the order they're called
+        self.functions = []
+        self.tick = 0
+        self.accumulator = 0
+        self.last_time = None
+        # Seconds each function took in the most recent tick it ran
+        self.function_to_time = dict()
+        self.last_tick_time = 0
+        self.max_tick_time = 0
+        self.num_overruns = 0
+        self.num_skipped = 0
+        self.last_report_time = 0
+        self.num_unreported = 0
+
+    def add(self, function, interval=PHYSICS_UPDATE_RATE):
+        """Calls function every interval seconds, after the functions already added
+
+        interval is rounded to a whole number of ticks"""
+        self.functions.append((function, max(1, round(interval / self.tick_rate))))
+
+    def update(self):
+        now = time.perf_counter()
+        if self.last_time is None:
+            self.last_time = now
+            return
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        num_ticks = 0
+        while self.accumulator >= self.tick_rate:
+            if num_ticks == self.max_catch_up:
+                skipped = int(self.accumulator // self.tick_rate)
+                self.num_skipped += skipped
+                self.accumulator -= skipped * self.tick_rate
+                print(f"Server fell behind, skipped {skipped} ticks")
+                break
+            self.run_tick()
+            self.accumulator -= self.tick_rate
+            num_ticks += 1
+
+    def run_tick(self):
+        start = time.perf_counter()
+        for function, every in self.functions:
+            if self.tick % every == 0:
+                function_start = time.perf_counter()
+                function()
+                self.function_to_time[function.__name__] = time.perf_counter() - function_start
+        self.tick += 1
+        self.last_tick_time = time.perf_counter() - start
+        self.max_tick_time = max(self.max_tick_time, self.last_tick_time)
+        if self.last_tick_time > self.tick_rate:
+            self.num_overruns += 1
+            self.report_overrun()
+
+    def report_overrun(self):
+        """Prints the slowest functions of an overrunning tick, at most once per second"""
+        self.num_unreported += 1
+        now = time.perf_counter()
+        if now - self.last_report_time < 1:
+            return
+        self.last_report_time = now
+        slowest = sorted(self.function_to_time.items(), key=lambda item: item[1], reverse=True)[:3]
+        breakdown = ", ".join(f"{name} {t * 1000:.1f} ms" for name, t in slowest)
+        print(f"{self.num_unreported} ticks over the {self.tick_rate * 1000:.0f} ms budget, "
+              f"last took {self.last_tick_time * 1000:.1f} ms ({breakdown})")
+        self.num_unreported = 0
@@ -8,11 +8,16 @@ from .combat_system import CombatSystem
 from .death_system import DeathSystem
 from .effect_system import EffectSystem
 from .gamestate import GameState
+from .interest_manager import InterestManager
 from .items_manager import ItemsManager
 from .movement_system import MovementSystem
+from .send_scheduler import SendScheduler
 from .power_system import PowerSystem
+from .replication_system import ReplicationSystem
 from .stat_manager import StatManager
+from .ticker import ServerTicker
 from ..power import Power
+from ..collision import CollisionWorld
 from .. import *
 
 
@@ -30,12 +35,29 @@ class World:
         self.inst_id_to_item = self.gamestate.inst_id_to_item
 
         self.stat_manager = StatManager(self.gamestate)
+        self.interest_manager = InterestManager(self.gamestate)
         self.combat_system = CombatSystem(self.gamestate, self.stat_manager)
         self.death_system = DeathSystem(self.gamestate)
         self.effect_system = EffectSystem(self.gamestate, self.stat_manager)
         self.items_manager = ItemsManager(self.gamestate, self.stat_manager)
-        self.power_system = PowerSystem(self.gamestate, self.effect_system)
-        self.movement_system = MovementSystem(self.gamestate)
+        self.power_system = PowerSystem(self.gamestate, self.effect_system, self.stat_manager)
+        self.send_scheduler = SendScheduler(self.gamestate)
+        self.movement_system = MovementSystem(self.gamestate, self.interest_manager, self.send_scheduler)
+        self.replication_system = ReplicationSystem(self.gamestate, self.stat_manager)
+
+        # Order matters: requests are handled at the start of the tick, combat states changed by
+        # any system are replicated at the end of it, and GameEvents such as the killing blow are
+        # sent before the deaths they caused
+        self.ticker = ServerTicker()
+        self.ticker.add(network.peer.update)
+        self.ticker.add(self.movement_system.tick_physics)
+        self.ticker.add(self.combat_system.tick_combat, POWER_UPDATE_RATE)
+        self.ticker.add(self.effect_system.tick_effects, POWER_UPDATE_RATE)
+        self.ticker.add(self.power_system.tick_cooldowns, POWER_UPDATE_RATE)
+        self.ticker.add(network.flush_events)
+        self.ticker.add(self.death_system.check_deaths, POWER_UPDATE_RATE)
+        self.ticker.add(self.replication_system.tick_replication)
+        self.ticker.add(network.stats.update)
 
     def load_zone(self, file):
         """Load the world by parsing a json
@@ -44,10 +66,16 @@ class World:
         zonepath = os.path.join(self.zones_path, file)
         with open(zonepath) as f:
             world_data = json.load(f)
+        # Positions are sent relative to the zone's origin
+        PackedPosition.configure(origin=world_data.get("origin", (0, 0, 0)))
+        self.collision_world = CollisionWorld()
         for name, data in world_data["entities"].items():
             if "color" in data and isinstance(data["color"], str):
                 data["color"] = color.colors[data["color"]]
+            self.collision_world.add_entity(name, data)
             Entity(**data)
+        self.collision_world.build()
+        set_collision_world(self.collision_world)
         for name, data in world_data["npcs"].items():
             data["cname"] = name
             init_dict = self.make_npc_init_dict(data)
@@ -103,10 +131,17 @@ class World:
             for effect in list(char.effects):
                 effect.remove()
             del char
+            network.clear_cbstate_baselines(uuid)
+            self.interest_manager.remove_char(uuid)
+            self.movement_system.remove_char(uuid)
+            self.send_scheduler.forget(uuid)
             if uuid in network.uuid_to_connection:
                 connection = network.uuid_to_connection[uuid]
                 del network.uuid_to_connection[uuid]
                 del network.connection_to_uuid[connection]
+                network.connection_to_cbstate_baselines.pop(connection, None)
+                self.interest_manager.remove_connection(connection)
+                self.send_scheduler.remove_connection(connection)
             if uuid in self.uuid_to_ctrl:
                 ctrl = self.uuid_to_ctrl[uuid]
                 destroy(ctrl)
@@ -22,44 +22,41 @@ def request_enter_world(connection, time_received, login_state: LoginState):
     network.uuid_to_connection[new_pc.uuid] = connection
     network.connection_to_uuid[connection] = new_pc.uuid
     network.peer.remote_load_world(connection, "demo.json")
-    # State for new character sent to this client
-    new_pc_spawn_state = PCSpawnState(new_pc)
-    # State for new character sent to other clients
-    new_npc_spawn_state = NPCSpawnState(new_pc)
-    # Need to update all clients
-    for conn in network.peer.get_connections():
-        if conn == connection:
-            # Send over PC and all NPC's
-            for uuid, ch in world.uuid_to_char.items():
-                if uuid == new_pc.uuid:
-                    network.peer.spawn_pc(connection, new_pc_spawn_state)
-                else:
-                    npc_spawn_state = NPCSpawnState(ch)
-                    network.peer.spawn_npc(conn, npc_spawn_state)
-        else:
-            # Existing users just need new character
-            network.peer.spawn_npc(conn, new_npc_spawn_state)
+    network.peer.spawn_pc(connection, PCSpawnState(new_pc))
+    network.set_cbstate_baseline(connection, new_pc)
+    # Send over nearby characters now, other clients will receive the new character
+    # once it's within their view
+    world.interest_manager.update_cell(new_pc.uuid, new_pc)
+    world.interest_manager.update_connection(connection)
+
+@rpc(network.peer)
+def request_spawn_chunk(connection, time_received):
+    """Client finished spawning the last chunk of characters and is ready for the next"""
+    world.interest_manager.send_spawn_chunk(connection)
 
 # PHYSICS
 @rpc(network.peer)
 def request_move(connection, time_received, sequence_number: int, kb_direction: Vec2,
-                 kb_y_rotation: int, mouse_y_rotation: float):
-    """Request server to process keyboard inputs for movement and rotation"""
+                 kb_y_rotation: int, mouse_y_rotation: float, jumped: bool):
+    """Request server to process keyboard inputs for movement and rotation.
+    Inputs are queued and applied on the next physics ticks, a jump on the same tick as
+    the input it was sent with."""
     uuid = network.connection_to_uuid[connection]
     char = world.uuid_to_char[uuid]
-    world.movement_system.handle_movement_inputs(
+    world.movement_system.queue_input(
         char,
         sequence_number,
         kb_direction,
         kb_y_rotation,
-        mouse_y_rotation
+        mouse_y_rotation,
+        jumped
     )
 
 @rpc(network.peer)
-def request_jump(connection, time_received):
-    uuid = network.connection_to_uuid[connection]
-    char = world.uuid_to_char[uuid]
-    char_start_jump(char)
+def request_ack_snapshots(connection, time_received, snapshot_ids: list[int]):
+    """Acknowledges snapshot datagrams the client handled, so the server can stop sending
+    characters whose resting state the client has"""
+    world.movement_system.ack_snapshots(connection, snapshot_ids)
 
 # COMBAT
 @rpc(network.peer)
@@ -112,4 +109,3 @@ def request_move_item(connection, time_received, item_id: int, to_container_name
     equipment = [item.inst_id if item is not None else -1 for item in char.equipment]
     inventory = [item.inst_id if item is not None else -1 for item in char.inventory]
     network.peer.remote_update_equipment_inventory(connection, equipment, inventory)
-    network.broadcast_cbstate_update(char)
@@ -0,0 +1,237 @@
+"""Precompiled binary encoders/decoders for States.
+
+A StateCodec is built once per State subclass from its statedef. Runs of fixed-width
+fields (int, float, bool, vectors, PackedTypes) are packed with a single struct.Struct,
+while str and list fields are written as length-prefixed blocks between them. The
+whole State is then written to the datagram at once, rather than one call to
+DatagramWriter.write per value. States with only fixed-width fields have a size known
+from the statedef (and the delta mask), so they're written as raw bytes; the rest are
+written as a length-prefixed blob."""
+import struct
+import typing
+
+from ursina import Vec2, Vec3, Vec4
+
+from .quantize import PackedType
+
+
+# Fixed-width types, mapped to their struct format and a constructor from unpacked args
+fixed_types = {
+    int: ("q", None),
+    float: ("d", None),
+    bool: ("?", None),
+    Vec2: ("dd", Vec2),
+    Vec3: ("ddd", Vec3),
+    Vec4: ("dddd", Vec4),
+}
+length_struct = struct.Struct("<H")
+str_length_struct = struct.Struct("<I")
+mask_struct = struct.Struct("<I")
+
+
+class Field:
+    """Encoding information for a single attr of a statedef.
+
+    For fixed-width fields, fmt is a struct format and to_args/from_args convert between
+    the value and the flat tuple of packed args (None meaning the value is packed as-is).
+    Variable-width fields have fmt None and are handled by encode_var/decode_var."""
+    def __init__(self, key, t):
+        self.key = key
+        self.t = t
+        self.to_args = None
+        self.from_args = None
+        self.item_struct = None
+        if isinstance(t, type) and issubclass(t, PackedType):
+            self.fmt = t.struct_format()
+            self.to_args = t.to_args
+            self.from_args = t.from_args
+        elif t in fixed_types:
+            self.fmt, constructor = fixed_types[t]
+            if constructor is not None:
+                self.to_args = tuple
+                self.from_args = lambda args, constructor=constructor: constructor(*args)
+        elif t is str:
+            self.fmt = None
+        elif typing.get_origin(t) is list:
+            self.fmt = None
+            item_type = typing.get_args(t)[0]
+            if item_type is not str:
+                if item_type not in fixed_types or fixed_types[item_type][1] is not None:
+                    raise TypeError(f"Unsupported list type in statedef: {t}")
+                self.item_struct = fixed_types[item_type][0]
+        else:
+            raise TypeError(f"Unsupported type in statedef: {t}")
+        if self.fmt is not None:
+            self.struct = struct.Struct("<" + self.fmt)
+            self.nargs = len(self.fmt)
+
+    def encode_var(self, value, out):
+        """Appends a length-prefixed str or list to the bytearray out"""
+        if self.t is str:
+            data = value.encode("utf-8")
+            out += str_length_struct.pack(len(data))
+            out += data
+        elif self.item_struct is None:
+            out += length_struct.pack(len(value))
+            for item in value:
+                data = item.encode("utf-8")
+                out += str_length_struct.pack(len(data))
+                out += data
+        else:
+            out += length_struct.pack(len(value))
+            out += struct.pack(f"<{len(value)}{self.item_struct}", *value)
+
+    def decode_var(self, buf, offset):
+        """Reads a length-prefixed str or list from buf, returns the value and the new offset"""
+        if self.t is str:
+            n, = str_length_struct.unpack_from(buf, offset)
+            offset += str_length_struct.size
+            return buf[offset:offset + n].decode("utf-8"), offset + n
+        n, = length_struct.unpack_from(buf, offset)
+        offset += length_struct.size
+        if self.item_struct is None:
+            items = []
+            for _ in range(n):
+                length, = str_length_struct.unpack_from(buf, offset)
+                offset += str_length_struct.size
+                items.append(buf[offset:offset + length].decode("utf-8"))
+                offset += length
+            return items, offset
+        items_struct = struct.Struct(f"<{n}{self.item_struct}")
+        return list(items_struct.unpack_from(buf, offset)), offset + items_struct.size
+
+
+class StateCodec:
+    """Encodes full States as a sequence of segments, and partial (delta) States as a
+    bitmask followed by the segments for the fields present.
+
+    The segments for each combination of present fields are compiled the first time it's
+    seen, so partial States get the same single-struct runs as full ones."""
+    def __init__(self, statedef):
+        self.format_version = PackedType.format_version
+        self.fields = [Field(key, t) for key, t in statedef.items()]
+        if len(self.fields) > 32:
+            raise TypeError(f"Statedefs have at most 32 attrs to fit in a delta mask, got {len(self.fields)}")
+        self.key_to_bit = {field.key: 1 << i for i, field in enumerate(self.fields)}
+        self.segments = self.make_segments(self.fields)
+        # Encoded size in bytes if every field is fixed-width, otherwise None
+        self.fixed_size = self.get_fixed_size(self.segments)
+        # Maps delta mask to the segments of the fields present in it, and their size
+        self.mask_to_segments = dict()
+        self.mask_to_size = dict()
+
+    def make_segments(self, fields):
+        """Returns segments for fields, each either a (struct, fields) pair for a run of
+        fixed-width fields, or a single variable-width Field"""
+        segments = []
+        run = []
+        for field in fields:
+            if field.fmt is not None:
+                run.append(field)
+                continue
+            if run:
+                segments.append(self.make_run(run))
+                run = []
+            segments.append(field)
+        if run:
+            segments.append(self.make_run(run))
+        return segments
+
+    def make_run(self, fields):
+        return (struct.Struct("<" + "".join(field.fmt for field in fields)), fields)
+
+    @staticmethod
+    def get_fixed_size(segments):
+        """Returns the total size of segments, or None if any are variable-width"""
+        if any(isinstance(segment, Field) for segment in segments):
+            return None
+        return sum(run_struct.size for run_struct, _ in segments)
+
+    def get_mask_segments(self, mask):
+        segments = self.mask_to_segments.get(mask)
+        if segments is None:
+            fields = [field for i, field in enumerate(self.fields) if mask & (1 << i)]
+            segments = self.mask_to_segments[mask] = self.make_segments(fields)
+            self.mask_to_size[mask] = self.get_fixed_size(segments)
+        return segments
+
+    def write(self, writer, state, partial=False):
+        """Writes a State to a DatagramWriter, as raw bytes if it's fixed-width"""
+        data = self.encode_partial(state) if partial else self.encode(state)
+        if self.fixed_size is None:
+            writer.write_blob(data)
+        else:
+            writer.datagram.appendData(data)
+
+    def read(self, reader, partial=False):
+        """Reads a State written by write from a DatagramReader, returns its (key, value) pairs"""
+        if self.fixed_size is None:
+            data = reader.read_blob()
+            return self.decode_partial(data) if partial else self.decode(data)
+        if not partial:
+            return self.decode(reader.iter.extractBytes(self.fixed_size))
+        mask_data = reader.iter.extractBytes(mask_struct.size)
+        mask, = mask_struct.unpack(mask_data)
+        segments = self.get_mask_segments(mask)
+        items, _ = self.decode_segments(reader.iter.extractBytes(self.mask_to_size[mask]), 0, segments)
+        return items
+
+    def encode(self, state):
+        out = bytearray()
+        self.encode_segments(state, self.segments, out)
+        return bytes(out)
+
+    def decode(self, buf):
+        """Returns a list of (key, value) pairs in statedef order"""
+        items, _ = self.decode_segments(buf, 0, self.segments)
+        return items
+
+    def encode_partial(self, state):
+        key_to_bit = self.key_to_bit
+        mask = 0
+        for key in state:
+            mask |= key_to_bit[key]
+        out = bytearray(mask_struct.pack(mask))
+        self.encode_segments(state, self.get_mask_segments(mask), out)
+        return bytes(out)
+
+    def decode_partial(self, buf):
+        """Returns a list of (key, value) pairs for the fields present in buf"""
+        mask, = mask_struct.unpack_from(buf, 0)
+        items, _ = self.decode_segments(buf, mask_struct.size, self.get_mask_segments(mask))
+        return items
+
+    def encode_segments(self, state, segments, out):
+        """Appends the encoded fields of segments to the bytearray out"""
+        for segment in segments:
+            if isinstance(segment, Field):
+                segment.encode_var(state[segment.key], out)
+                continue
+            run_struct, fields = segment
+            args = []
+            for field in fields:
+                if field.to_args is None:
+                    args.append(state[field.key])
+                else:
+                    args.extend(field.to_args(state[field.key]))
+            out += run_struct.pack(*args)
+
+    def decode_segments(self, buf, offset, segments):
+        """Returns the (key, value) pairs of segments read from buf at offset, and the new offset"""
+        items = []
+        for segment in segments:
+            if isinstance(segment, Field):
+                value, offset = segment.decode_var(buf, offset)
+                items.append((segment.key, value))
+                continue
+            run_struct, fields = segment
+            args = run_struct.unpack_from(buf, offset)
+            offset += run_struct.size
+            i = 0
+            for field in fields:
+                if field.from_args is None:
+                    items.append((field.key, args[i]))
+                else:
+                    items.append((field.key, field.from_args(args[i:i + field.nargs])))
+                i += field.nargs
+        return items, offset
@@ -1,6 +1,7 @@
 """Contains API for States, including functions for building states."""
 import os
 import json
+import operator
 import types
 import typing
 
@@ -8,6 +9,8 @@ from ursina import *
 from ursina import Vec3, Vec4
 
 from .base import *
+from .quantize import *
+from .state_codec import StateCodec
         
 
 class State(dict):
@@ -28,9 +31,20 @@ class State(dict):
     To define a new state, you should just need to define a custom statedef, which
     is a map from attr to type, and defaults, which is a map from attr to value,
     and must be defined on all keys of statedef.
+
+    States which are sent frequently but usually only change in a few fields can opt
+    into delta compression by setting delta_compressed. These are serialized with a
+    bitmask of the attrs present, followed by only those attrs. Use get_delta to
+    strip the attrs that are unchanged from a previously sent state.
+
+    Each subclass compiles a StateCodec from its statedef when it's defined, which is
+    used to serialize the whole State at once. It also compiles an attrgetter
+    for all attrs, so that building a State from an object that has every attr with the
+    right type skips the inference in _get_val_from_src.
     """
     statedef = {}
     defaults = {}
+    delta_compressed = False
     type_to_default = {
         int: 0,
         float: 0.0,
@@ -39,11 +53,35 @@ class State(dict):
         str: ""
     }
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.codec = StateCodec(cls.statedef)
+        attrs = list(cls.statedef)
+        if len(attrs) == 1:
+            getter = operator.attrgetter(attrs[0])
+            cls.attr_getter = lambda src: (getter(src),)
+        else:
+            cls.attr_getter = operator.attrgetter(*attrs)
+        # Generic aliases like list[int] never match, so lists always go through _convert_val
+        # and get copied rather than aliased
+        cls.value_types = [cls.get_value_type(attr) for attr in attrs]
+
     def __init__(self, src={}):
         """Populates self as a flat list, with defaults if missing.
         Will never have gaps.
 
         src: dict or Character object"""
+        if not isinstance(src, dict):
+            try:
+                vals = self.attr_getter(src)
+            except AttributeError:
+                pass
+            else:
+                for attr, value_type, val in zip(self.statedef, self.value_types, vals):
+                    if type(val) is not value_type:
+                        val = self._convert_val(attr, val)
+                    self[attr] = val
+                return
         for attr in self.statedef:
             self[attr] = self._get_val_from_src(attr, src)
 
@@ -57,24 +95,54 @@ class State(dict):
         # src is a typical data structure and contains attr
         elif hasattr(src, attr):
             val = getattr(src, attr)
+        return self._convert_val(attr, val)
+
+    def _convert_val(self, attr, val):
+        """Converts a value pulled from src to the type in the state definition,
+        or infers it if missing"""
         # couldn't find attr in src, look in defaults
         if val is None:
             # If not in class's defaults, infer based on type of attr
             if attr not in self.defaults:
-                return self.type_to_default[self.statedef[attr]]
+                return self.type_to_default[self.get_value_type(attr)]
             val = self.defaults[attr]
-        elif type(val) != self.statedef[attr]:
+        elif type(val) != self.get_value_type(attr):
             try:
-                val = self.statedef[attr](val)
+                val = self.get_value_type(attr)(val)
             except TypeError:
                 try:
-                    val = self.statedef[attr](*val)
+                    val = self.get_value_type(attr)(*val)
                 except TypeError:
                     if attr not in self.defaults:
-                        return self.type_to_default[self.statedef[attr]]
+                        return self.type_to_default[self.get_value_type(attr)]
                     val = self.defaults[attr]
         return val
 
+    @classmethod
+    def get_value_type(cls, attr):
+        """Returns the type of the value held in attr, which differs from its statedef entry
+        for PackedTypes"""
+        t = cls.statedef[attr]
+        if isinstance(t, type) and issubclass(t, PackedType):
+            return t.value_type
+        return t
+
+    @classmethod
+    def partial(cls, items=()):
+        """Makes a State directly from (attr, value) pairs, without filling defaults.
+        Used for deserializing and for the partial States of delta compression."""
+        state = cls.__new__(cls)
+        dict.update(state, items)
+        return state
+
+    def get_delta(self, baseline):
+        """Returns a partial State containing only the attrs which differ from baseline
+
+        baseline: State of the same type that the receiver already has, or None"""
+        if baseline is None:
+            return self
+        return self.partial((k, v) for k, v in self.items() if baseline.get(k) != v)
+
     def apply(self, dst):
         """Apply attrs to a destination object by overwriting the attrs
         
@@ -82,18 +150,20 @@ class State(dict):
         for k, v in self.items():
             setattr(dst, k, v)
 
+    @classmethod
+    def get_codec(cls):
+        """Returns the compiled codec, rebuilding it if a PackedType's format changed"""
+        if cls.codec.format_version != PackedType.format_version:
+            cls.codec = StateCodec(cls.statedef)
+        return cls.codec
+
     @classmethod
     def serialize(cls, writer, state):
-        for v in state.values():
-            writer.write(v)
+        cls.get_codec().write(writer, state, cls.delta_compressed)
 
     @classmethod
     def deserialize(cls, reader):
-        state = cls()
-        for k, t in cls.statedef.items():
-            v = reader.read(t)
-            state[k] = v
-        return state
+        return cls.partial(cls.get_codec().read(reader, cls.delta_compressed))
 
 
 class LoginState(State):
@@ -146,8 +216,8 @@ class PCSpawnState(State):
         "model_name": str,
         "model_color": Vec4,
         "scale": Vec3,
-        "position": Vec3,
-        "rotation": Vec3,
+        "position": PackedPosition,
+        "rotation_y": PackedAngle,
         "health": int,
         "energy": int,
         "statichealth": int,
@@ -179,8 +249,8 @@ class NPCSpawnState(State):
         "model_name": str,
         "model_color": Vec4,
         "scale": Vec3,
-        "position": Vec3,
-        "rotation": Vec3,
+        "position": PackedPosition,
+        "rotation_y": PackedAngle,
         "health": int,
         "energy": int,
         "maxhealth": int,
@@ -190,6 +260,7 @@ class NPCSpawnState(State):
 
 class PlayerCombatState(State):
     """Used for authoritative stat updates for the player character"""
+    delta_compressed = True
     statedef = {
         "health": int,
         "maxhealth": int,
@@ -209,6 +280,7 @@ class PlayerCombatState(State):
 
 class NPCCombatState(State):
     """Used for authoritative stat updates for NPCs"""
+    delta_compressed = True
     statedef = {
         "health": int,
         "maxhealth": int,
@@ -216,6 +288,44 @@ class NPCCombatState(State):
     defaults = default_char_attrs
 
 
+class SnapshotState(State):
+    """Physical state of a single character within a world snapshot.
+    src should be a ServerCharacter"""
+    statedef = {
+        "uuid": int,
+        "position": PackedPosition,
+        "rotation_y": PackedAngle,
+    }
+    defaults = default_char_attrs
+
+
+class GameEvent(State):
+    """Something that happened in the game that a client should print, sent instead of the
+    formatted text. Clients look up the template from event_id and the names of the
+    characters from their uuids.
+    src should be a dict"""
+    statedef = {
+        "event_id": int,
+        "src_uuid": int,
+        "tgt_uuid": int,
+        "val": int,
+    }
+    defaults = {
+        "src_uuid": -1,
+        "tgt_uuid": -1,
+    }
+
+    @classmethod
+    def make(cls, event, src=None, tgt=None, val=0):
+        """Makes a GameEvent from the name of an event and the characters involved"""
+        return cls({
+            "event_id": event_to_idx[event],
+            "src_uuid": src.uuid if src is not None else -1,
+            "tgt_uuid": tgt.uuid if tgt is not None else -1,
+            "val": val,
+        })
+
+
 class Stats(State):
     """Used for common stat updates from items and effects."""
     statedef = {
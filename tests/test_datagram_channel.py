@@ -0,0 +1,62 @@
+from ursina.networking import procedure_hash
+
+from source.datagram_channel import DatagramChannel, header_struct, DATA
+from source.netstats import InstrumentedRPCPeer
+
+
+class FakeConnection:
+    address = ("127.0.0.1", 0)
+
+    def disconnect(self):
+        raise AssertionError("Datagram caused a disconnect")
+
+
+def make_channel():
+    peer = InstrumentedRPCPeer()
+    received = []
+
+    def remote_test_datagram(connection, time_received, value: int):
+        received.append(value)
+
+    peer.register_procedure(remote_test_datagram)
+    return DatagramChannel(peer), received
+
+
+def make_packet(channel, tick, value):
+    writer = channel.rpc_peer.writer
+    writer.clear()
+    writer.write_int32(procedure_hash("remote_test_datagram"))
+    writer.write(value)
+    return header_struct.pack(DATA, tick) + writer.get_datagram().getMessage()
+
+
+def test_deliver_handles_and_records_datagram():
+    channel, received = make_channel()
+    connection = FakeConnection()
+    packet = make_packet(channel, 1, 5)
+    channel.deliver(connection, packet, 0)
+    assert received == [5]
+    stats = channel.rpc_peer.stats
+    assert stats.get_num_received("remote_test_datagram") == 1
+    assert stats.name_to_stats["remote_test_datagram"].received_bytes == len(packet)
+
+
+def test_deliver_drops_stale_datagram():
+    channel, received = make_channel()
+    connection = FakeConnection()
+    channel.deliver(connection, make_packet(channel, 2, 1), 0)
+    channel.deliver(connection, make_packet(channel, 1, 2), 0)
+    assert received == [1]
+    assert channel.num_stale == 1
+
+
+def test_deliver_drops_malformed_datagram():
+    channel, received = make_channel()
+    connection = FakeConnection()
+    packet = make_packet(channel, 1, 5)
+    channel.deliver(connection, packet[:-1], 0)
+    channel.deliver(connection, packet + b"\0", 0)
+    channel.deliver(connection, header_struct.pack(DATA, 1) + b"\0\0\0\0", 0)
+    assert received == []
+    assert channel.num_malformed == 3
+    assert channel.rpc_peer.stats.get_num_received("remote_test_datagram") == 0
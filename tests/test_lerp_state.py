@@ -0,0 +1,25 @@
+from ursina import Vec3
+
+from source.physics import PHYSICS_UPDATE_RATE
+from source.client.lerp_system import LerpState
+
+
+class FakeCharacter:
+    position = Vec3(0, 0, 0)
+    rotation_y = 0
+
+
+def test_held_gap_inserts_sample_at_previous_position():
+    lerp_state = LerpState(FakeCharacter())
+    lerp_state.add_snapshot(0, Vec3(0, 0, 0), 0)
+    lerp_state.add_snapshot(10 * PHYSICS_UPDATE_RATE, Vec3(1, 0, 0), 0, held=True)
+    assert [sample[0] for sample in lerp_state.snapshots] == [0, 9 * PHYSICS_UPDATE_RATE,
+                                                               10 * PHYSICS_UPDATE_RATE]
+    assert lerp_state.snapshots[1][1] == Vec3(0, 0, 0)
+
+
+def test_scheduling_gap_is_interpolated():
+    lerp_state = LerpState(FakeCharacter())
+    lerp_state.add_snapshot(0, Vec3(0, 0, 0), 0)
+    lerp_state.add_snapshot(3 * PHYSICS_UPDATE_RATE, Vec3(3, 0, 0), 0)
+    assert [sample[0] for sample in lerp_state.snapshots] == [0, 3 * PHYSICS_UPDATE_RATE]
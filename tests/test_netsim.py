@@ -0,0 +1,13 @@
+import pytest
+
+from source.netsim import parse_conditions
+
+
+def test_parse_conditions():
+    assert parse_conditions("seed=3, latency=0.1,loss=0.02") == {"seed": 3, "latency": 0.1, "loss": 0.02}
+    assert parse_conditions("") == {}
+
+
+def test_parse_conditions_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        parse_conditions("lag=0.1")
@@ -0,0 +1,30 @@
+from ursina.networking import procedure_hash
+
+from source.netstats import InstrumentedRPCPeer
+
+
+class FakeConnection:
+    address = ("127.0.0.1", 0)
+
+    def disconnect(self):
+        raise AssertionError("Valid RPC caused a disconnect")
+
+
+def test_rpc_on_data_records_procedure_name():
+    peer = InstrumentedRPCPeer()
+    received = []
+
+    def remote_test_stats(connection, time_received, value: int):
+        received.append(value)
+
+    peer.register_procedure(remote_test_stats)
+    peer.writer.clear()
+    peer.writer.write_int32(procedure_hash("remote_test_stats"))
+    peer.writer.write(7)
+    data = peer.writer.get_datagram().getMessage()
+    connection = FakeConnection()
+    peer.rpc_on_data(connection, data, 0)
+    assert received == [7]
+    assert peer.stats.get_num_received("remote_test_stats") == 1
+    assert peer.stats.get_num_received("<unknown>") == 0
+    assert peer.stats.connection_to_stats[connection]["remote_test_stats"].received_bytes == len(data)
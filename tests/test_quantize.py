@@ -0,0 +1,73 @@
+import random
+import struct
+
+import pytest
+from ursina import Vec3
+
+from source.quantize import PackedPosition, PackedAngle
+
+
+@pytest.fixture(autouse=True)
+def restore_config():
+    position_config = (PackedPosition.quantum, PackedPosition.bits, PackedPosition.origin)
+    angle_bits = PackedAngle.bits
+    yield
+    PackedPosition.configure(*position_config)
+    PackedAngle.configure(angle_bits)
+
+
+def round_trip(packed_type, value):
+    """Packs value into bytes and back, the same way StateCodec does"""
+    packer = struct.Struct("<" + packed_type.struct_format())
+    return packed_type.from_args(packer.unpack(packer.pack(*packed_type.to_args(value))))
+
+
+def angle_error(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+@pytest.mark.parametrize("bits", [16, 24, 32])
+def test_position_error_within_max_error(bits):
+    PackedPosition.configure(bits=bits, origin=(10, -5, 3))
+    limit = min(1000, PackedPosition.quantum * (1 << (bits - 1)) - 1)
+    rng = random.Random(bits)
+    for _ in range(5000):
+        pos = Vec3(*(o + rng.uniform(-limit, limit) for o in PackedPosition.origin))
+        decoded = round_trip(PackedPosition, pos)
+        for a, b in zip(pos, decoded):
+            # Vec3 holds 32 bit floats
+            assert abs(a - b) <= PackedPosition.max_error() + 1e-4 * max(1, abs(a))
+
+
+@pytest.mark.parametrize("bits", [16, 24, 32])
+def test_position_clamps_to_range_edges(bits):
+    PackedPosition.configure(bits=bits, quantum=1 / 256, origin=(0, 0, 0))
+    highest = PackedPosition.quantum * ((1 << (bits - 1)) - 1)
+    lowest = -PackedPosition.quantum * (1 << (bits - 1))
+    assert round_trip(PackedPosition, Vec3(1e12, highest, 0)) == Vec3(highest, highest, 0)
+    assert round_trip(PackedPosition, Vec3(-1e12, lowest, 0)) == Vec3(lowest, lowest, 0)
+
+
+@pytest.mark.parametrize("bits", [8, 16])
+def test_angle_error_within_max_error(bits):
+    PackedAngle.configure(bits)
+    rng = random.Random(bits)
+    for _ in range(5000):
+        angle = rng.uniform(-1000, 1000)
+        decoded = round_trip(PackedAngle, angle)
+        assert 0 <= decoded < 360
+        assert angle_error(angle, decoded) <= PackedAngle.max_error() + 1e-9
+
+
+@pytest.mark.parametrize("bits", [8, 16])
+def test_angle_wraps_around(bits):
+    PackedAngle.configure(bits)
+    assert round_trip(PackedAngle, 0) == 0
+    assert round_trip(PackedAngle, 360) == 0
+    assert round_trip(PackedAngle, -360) == 0
+    # Just below a full turn rounds up to 0 rather than overflowing
+    assert round_trip(PackedAngle, 360 - PackedAngle.max_error() / 2) == 0
+    assert round_trip(PackedAngle, -PackedAngle.max_error() / 2) == 0
+    assert round_trip(PackedAngle, 180) == 180
+    assert round_trip(PackedAngle, -90) == 270
+    assert round_trip(PackedAngle, 450) == 90
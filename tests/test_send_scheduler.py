@@ -0,0 +1,66 @@
+import pytest
+
+from source.base import PHYSICS_UPDATE_RATE, SEND_BUDGET_DEFAULT, SEND_BUDGET_MIN
+from source.server import send_scheduler
+from source.server.send_scheduler import ConnectionRate
+
+RTT = 0.1
+# Seconds between a client's reports
+REPORT_INTERVAL = 1
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(send_scheduler, "time", fake)
+    return fake
+
+
+def simulate(fake_time, rate, loss_every=0, num_reports=30, limited=True):
+    """Sends one snapshot message per tick to a client over a link with a fixed RTT, which
+    drops every loss_every-th message, and feeds its reports to rate"""
+    # Times messages arrive at the client
+    arrivals = []
+    num_sent = 0
+    next_report = REPORT_INTERVAL
+    start = fake_time.now
+    for tick in range(int(num_reports * REPORT_INTERVAL / PHYSICS_UPDATE_RATE)):
+        fake_time.now = start + tick * PHYSICS_UPDATE_RATE
+        num_sent += 1
+        rate.record_sent(1)
+        rate.limited = rate.limited or limited
+        if not loss_every or num_sent % loss_every:
+            arrivals.append(fake_time.now + RTT / 2)
+        if fake_time.now - start >= next_report:
+            # The report was made half a round trip ago
+            made = fake_time.now - RTT / 2
+            rate.update(RTT, sum(1 for t in arrivals if t <= made))
+            next_report += REPORT_INTERVAL
+
+
+def test_lossless_link_keeps_or_raises_budget(fake_time):
+    rate = ConnectionRate()
+    simulate(fake_time, rate)
+    assert rate.num_decreases == 0
+    assert rate.budget > SEND_BUDGET_DEFAULT
+
+
+def test_unlimited_lossless_link_keeps_budget(fake_time):
+    rate = ConnectionRate()
+    simulate(fake_time, rate, limited=False)
+    assert rate.budget == SEND_BUDGET_DEFAULT
+
+
+def test_lossy_link_lowers_budget(fake_time):
+    rate = ConnectionRate()
+    simulate(fake_time, rate, loss_every=4)
+    assert rate.num_decreases > 0
+    assert rate.budget == SEND_BUDGET_MIN
@@ -0,0 +1,71 @@
+import pytest
+from ursina import Vec3
+
+from source.base import SNAPSHOT_CHUNK_BITS
+from source.network import network
+from source.server.gamestate import GameState
+from source.server.movement_system import MovementSystem, MovementState
+
+CONNECTION = "connection"
+
+
+class FakeCharacter:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.position = Vec3(0, 0, 0)
+        self.rotation_y = 0
+
+
+class FakeInterestManager:
+    def get_visible(self, connection):
+        return [1, 2]
+
+
+class FakeSendScheduler:
+    def select(self, connection, uuid, candidates, entry_size):
+        return candidates
+
+    def record_sent(self, connection, num_messages):
+        pass
+
+
+@pytest.fixture
+def movement_system(monkeypatch):
+    gamestate = GameState()
+    system = MovementSystem(gamestate, FakeInterestManager(), FakeSendScheduler())
+    for uuid in (1, 2):
+        gamestate.uuid_to_char[uuid] = FakeCharacter(uuid)
+        system.movement_states[uuid] = MovementState()
+    system.sent = []
+    monkeypatch.setattr(network, "send_unreliable", lambda conn, tick, name, *args: system.sent.append(args))
+    monkeypatch.setattr(network, "connection_to_uuid", {CONNECTION: 1})
+    return system
+
+
+def send(movement_system):
+    """Returns (snapshot id, uuids, held mask) of each datagram sent for one tick"""
+    movement_system.sent.clear()
+    movement_system.send_snapshots()
+    return [(args[1], [state["uuid"] for state in args[3]], args[4]) for args in movement_system.sent]
+
+
+def test_stopped_character_is_resent_until_acknowledged(movement_system):
+    [(snapshot_id, _, _)] = send(movement_system)
+    movement_system.ack_snapshots(CONNECTION, [snapshot_id])
+    movement_system.uuid_to_char[2].position = Vec3(1, 0, 0)
+    # The first two snapshots with its resting position are lost
+    assert send(movement_system)[0][1] == [2]
+    assert send(movement_system)[0][1] == [2]
+    [(snapshot_id, uuids, _)] = send(movement_system)
+    assert uuids == [2]
+    movement_system.ack_snapshots(CONNECTION, [snapshot_id])
+    assert send(movement_system) == []
+
+
+def test_only_characters_left_out_for_not_moving_are_held(movement_system):
+    [(snapshot_id, _, held_mask)] = send(movement_system)
+    assert held_mask == 0
+    movement_system.ack_snapshots(CONNECTION, [snapshot_id])
+    assert send(movement_system) == []
+    movement_system.uuid_to_char[2].position = Vec3(1, 0, 0)
+    assert send(movement_system) == [(movement_system.tick << SNAPSHOT_CHUNK_BITS, [2], 1)]
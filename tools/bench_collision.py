@@ -0,0 +1,110 @@
+"""Times ray queries against a generated zone of box colliders, with CollisionWorld's BVH,
+a linear scan over every box, and raycast_batch.
+
+    python -m tools.bench_collision [num_boxes] [num_rays]
+
+Every ray's BVH hit is checked against the linear scan's first, and raycast_batch's against
+the BVH's, so a culling bug fails loudly instead of showing up as a speedup."""
+import math
+import random
+import sys
+import time
+
+from ursina import Ursina
+
+app = Ursina(window_type="none")
+
+from source.collision import CollisionWorld, np
+
+ZONE_SIZE = 200
+MAX_DISTANCE = 20
+TOLERANCE = 1e-6
+
+
+def make_world(num_boxes, seed=0):
+    """Returns a CollisionWorld of a floor and num_boxes randomly placed and rotated boxes"""
+    rng = random.Random(seed)
+    world = CollisionWorld()
+    world.add_entity("floor", {"model": "plane", "collider": "box", "scale": (ZONE_SIZE, 1, ZONE_SIZE)})
+    for i in range(num_boxes):
+        world.add_entity(f"box{i}", {
+            "model": "cube",
+            "collider": "box",
+            "position": (rng.uniform(-ZONE_SIZE / 2, ZONE_SIZE / 2), rng.uniform(0, 10),
+                         rng.uniform(-ZONE_SIZE / 2, ZONE_SIZE / 2)),
+            "rotation": (rng.uniform(-30, 30), rng.uniform(0, 360), rng.uniform(-30, 30)),
+            "scale": (rng.uniform(0.5, 5), rng.uniform(0.5, 5), rng.uniform(0.5, 5)),
+        })
+    world.build()
+    return world
+
+
+def make_rays(world, num_rays, seed=1):
+    rng = random.Random(seed)
+    lower, upper = world.get_bounds()
+    rays = []
+    for _ in range(num_rays):
+        origin = tuple(rng.uniform(lo, hi) for lo, hi in zip(lower, upper))
+        direction = (rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1))
+        length = math.sqrt(sum(d * d for d in direction))
+        direction = tuple(d / length for d in direction)
+        rays.append((origin, direction, rng.uniform(0, MAX_DISTANCE)))
+    return rays
+
+
+def linear_raycast(world, origin, direction, distance):
+    """Returns (box, distance) of the first box hit by testing every box, or None"""
+    closest = None
+    for box in world.boxes:
+        intersection = box.intersect_ray(origin, direction, distance)
+        if intersection is not None:
+            distance = intersection[0]
+            closest = (box, distance)
+    return closest
+
+
+def check_hit(label, ray, hit, distance, expected):
+    if expected is None:
+        assert not hit, f"{label} hit a box the linear scan missed, ray {ray}"
+    else:
+        assert hit, f"{label} missed a box the linear scan hit, ray {ray}"
+        assert abs(distance - expected[1]) <= TOLERANCE, \
+            f"{label} hit at {distance}, linear scan at {expected[1]}, ray {ray}"
+
+
+def main(num_boxes=3000, num_rays=2000):
+    world = make_world(num_boxes)
+    rays = make_rays(world, num_rays)
+    # The linear scan is slow, time it on a subset
+    linear_rays = rays[:max(1, num_rays // 10)]
+    start = time.perf_counter()
+    linear_hits = [linear_raycast(world, *ray) for ray in linear_rays]
+    linear_time = (time.perf_counter() - start) / len(linear_rays)
+
+    start = time.perf_counter()
+    bvh_hits = [world.raycast(*ray) for ray in rays]
+    bvh_time = (time.perf_counter() - start) / len(rays)
+    for ray, hit, expected in zip(linear_rays, bvh_hits, linear_hits):
+        check_hit("BVH", ray, hit.hit, hit.distance, expected)
+
+    print(f"{num_boxes} boxes, {num_rays} rays of up to {MAX_DISTANCE} units, "
+          f"{sum(hit.hit for hit in bvh_hits)} hits")
+    print(f"linear scan     {linear_time * 1e6:9.1f} us/ray")
+    print(f"BVH             {bvh_time * 1e6:9.1f} us/ray")
+    if np is None:
+        print("NumPy isn't installed, skipping raycast_batch")
+        return
+    origins = np.array([ray[0] for ray in rays])
+    directions = np.array([ray[1] for ray in rays])
+    distances = np.array([ray[2] for ray in rays])
+    start = time.perf_counter()
+    hit, hit_distances, _, _ = world.raycast_batch(origins, directions, distances)
+    batch_time = (time.perf_counter() - start) / len(rays)
+    for i, ray in enumerate(rays):
+        expected = (None, bvh_hits[i].distance) if bvh_hits[i].hit else None
+        check_hit("raycast_batch", ray, hit[i], hit_distances[i], expected)
+    print(f"raycast_batch   {batch_time * 1e6:9.1f} us/ray")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
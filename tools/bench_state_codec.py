@@ -0,0 +1,138 @@
+"""Times serializing States with their compiled StateCodec against the previous approach of
+one DatagramWriter.write call per value.
+
+    python -m tools.bench_state_codec
+
+Both paths are checked to round-trip the same States before they're timed."""
+import timeit
+from typing import get_args, get_origin
+
+from ursina import Ursina, Vec3
+from ursina.networking import DatagramWriter, DatagramReader
+
+app = Ursina(window_type="none")
+
+from source.quantize import PackedPosition, PackedAngle
+from source.states import PCSpawnState, PlayerCombatState, SnapshotState
+
+NUMBER = 20000
+
+
+def legacy_write_val(writer, t, v):
+    """Writes a value the way States did before StateCodec"""
+    if t is PackedPosition:
+        for i in PackedPosition.encode(v):
+            if PackedPosition.bits == 16:
+                writer.write_int16(i)
+            elif PackedPosition.bits == 24:
+                writer.write_int16(i >> 8)
+                writer.write_int8((i & 0xFF) - 128)
+            else:
+                writer.write_int32(i)
+    elif t is PackedAngle:
+        if PackedAngle.bits == 8:
+            writer.write_int8(PackedAngle.encode(v))
+        else:
+            writer.write_int16(PackedAngle.encode(v))
+    else:
+        writer.write(v)
+
+
+def legacy_read_val(reader, t):
+    if t is PackedPosition:
+        ints = []
+        for _ in range(3):
+            if PackedPosition.bits == 16:
+                ints.append(reader.read_int16())
+            elif PackedPosition.bits == 24:
+                hi = reader.read_int16()
+                ints.append((hi << 8) + reader.read_int8() + 128)
+            else:
+                ints.append(reader.read_int32())
+        return PackedPosition.decode(ints)
+    if t is PackedAngle:
+        if PackedAngle.bits == 8:
+            return PackedAngle.decode(reader.read_int8())
+        return PackedAngle.decode(reader.read_int16())
+    if get_origin(t) is not None:
+        # DatagramReader describes generic types like list[int] as (list, (int,))
+        t = (get_origin(t), get_args(t))
+    return reader.read(t)
+
+
+def legacy_serialize(cls, writer, state):
+    if cls.delta_compressed:
+        mask = 0
+        for i, k in enumerate(cls.statedef):
+            if k in state:
+                mask |= 1 << i
+        writer.write_int32(mask)
+        for k, t in cls.statedef.items():
+            if k in state:
+                legacy_write_val(writer, t, state[k])
+        return
+    for k, t in cls.statedef.items():
+        legacy_write_val(writer, t, state[k])
+
+
+def legacy_deserialize(cls, reader):
+    if cls.delta_compressed:
+        mask = reader.read_int32()
+        state = cls.partial()
+        for i, (k, t) in enumerate(cls.statedef.items()):
+            if mask & (1 << i):
+                state[k] = legacy_read_val(reader, t)
+        return state
+    state = cls.partial()
+    for k, t in cls.statedef.items():
+        state[k] = legacy_read_val(reader, t)
+    return state
+
+
+def make_states():
+    spawn = PCSpawnState({"uuid": 7, "cname": "Bench", "position": Vec3(12.5, 0, -3.25),
+                          "skills": [1, 2, 3]})
+    combat = PlayerCombatState({"health": 50, "maxhealth": 100})
+    delta = combat.get_delta(PlayerCombatState({"health": 60, "maxhealth": 100}))
+    snapshot = SnapshotState({"uuid": 3, "position": Vec3(1, 2, 3), "rotation_y": 90})
+    return [("PCSpawnState", spawn), ("PlayerCombatState", combat),
+            ("PlayerCombatState delta", delta), ("SnapshotState", snapshot)]
+
+
+def bench(name, state):
+    cls = type(state)
+    writer = DatagramWriter()
+    reader = DatagramReader()
+
+    def legacy_encode():
+        writer.clear()
+        legacy_serialize(cls, writer, state)
+        return writer.get_datagram()
+
+    def codec_encode():
+        writer.clear()
+        cls.serialize(writer, state)
+        return writer.get_datagram()
+
+    legacy_datagram = legacy_encode()
+    codec_datagram = codec_encode()
+
+    def legacy_decode():
+        reader.set_datagram(legacy_datagram)
+        return legacy_deserialize(cls, reader)
+
+    def codec_decode():
+        reader.set_datagram(codec_datagram)
+        return cls.deserialize(reader)
+
+    assert legacy_decode().keys() == codec_decode().keys() == state.keys(), name
+    times = [min(timeit.repeat(f, number=NUMBER, repeat=7)) / NUMBER * 1e6
+             for f in (legacy_encode, codec_encode, legacy_decode, codec_decode)]
+    print(f"{name:25} encode {times[0]:6.2f} -> {times[1]:6.2f} us ({times[0] / times[1]:4.1f}x)   "
+          f"decode {times[2]:6.2f} -> {times[3]:6.2f} us ({times[2] / times[3]:4.1f}x)   "
+          f"{legacy_datagram.getLength()} -> {codec_datagram.getLength()} bytes")
+
+
+if __name__ == "__main__":
+    for name, state in make_states():
+        bench(name, state)
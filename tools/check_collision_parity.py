@@ -0,0 +1,49 @@
+"""Checks that CollisionWorld answers ray queries the same as Ursina's raycast in a zone.
+
+    python -m tools.check_collision_parity [zone file] [num rays]
+
+Loads the zone's entities headless, the same way World.load_zone does, then casts random
+rays through it with both. Exits with an error listing the rays where they disagree by more
+than check_parity's tolerance."""
+import json
+import os
+import sys
+
+from ursina import Ursina, Entity, color
+
+app = Ursina(window_type="none")
+
+from source.base import data_path
+from source.collision import CollisionWorld
+
+SEEDS = range(3)
+
+
+def load_zone(file):
+    """Returns a CollisionWorld of the zone's entities, which are also added to the scene"""
+    with open(os.path.join(data_path, "zones", file)) as f:
+        world_data = json.load(f)
+    collision_world = CollisionWorld()
+    for name, data in world_data["entities"].items():
+        if "color" in data and isinstance(data["color"], str):
+            data["color"] = color.colors[data["color"]]
+        collision_world.add_entity(name, data)
+        Entity(**data)
+    collision_world.build()
+    return collision_world
+
+
+def main(file="demo.json", num_rays=3000):
+    collision_world = load_zone(file)
+    mismatches = []
+    for seed in SEEDS:
+        mismatches += collision_world.check_parity(num_rays=num_rays, seed=seed)
+    for origin, direction, distance, reason in mismatches:
+        print(f"origin {origin}, direction {direction}, distance {distance}: {reason}")
+    total = num_rays * len(SEEDS)
+    assert not mismatches, f"{len(mismatches)} of {total} rays differ from Ursina's raycast"
+    print(f"All {total} rays match Ursina's raycast in {file}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2], *(int(arg) for arg in sys.argv[2:3]))